@@ -20,11 +20,19 @@ import dash
 from werkzeug.middleware.proxy_fix import ProxyFix
 from dash import Dash, html
 import dash_bootstrap_components as dbc 
-
+from utils.cache import background_callback_manager
+from utils.http_cache import init_http_cache
+from utils.api import api
+from utils.catalogue import DATA_DIR
+from utils.watcher import start_watcher
+
+# Long running callbacks (fits of many data sets, zip downloads) are executed as background jobs by
+# background_callback_manager (see utils/cache.py), so they don't block the gunicorn threads.
 app = Dash(__name__, use_pages=True, external_stylesheets=[dbc.themes.BOOTSTRAP],
            meta_tags=[
         {"name": "viewport", "content": "width=device-width, initial-scale=1.0"}
-    ],)
+    ],
+           background_callback_manager=background_callback_manager,)
 
 app.config.suppress_callback_exceptions=True
 app.title = "Level Densities"
@@ -50,6 +58,17 @@ def set_no_transform(response):
         pass
     return response
 
+# Compression (gzip/brotli), content-hash ETags with 304 answers and long max-age for fingerprinted resources,
+# plus the /datasets/<Datafile> route (see utils/http_cache.py). It has to be registered after set_no_transform.
+init_http_cache(server)
+
+# Read-only REST API for programmatic access to the catalogue, the data and the fits (see utils/api.py).
+server.register_blueprint(api)
+
+# The catalogue and the data files are reloaded when they change in NLD_DATA_DIR (see utils/watcher.py). The watcher thread
+# is started by the gunicorn workers once they have loaded the app (gunicorn.conf.py), not here: the background jobs are
+# forked from a process that imports this module too (see utils/cache.py), and it must not run any thread.
+
 # Ensure Dash component libraries are registered early. In some deployment setups
 # (preloaded workers / different request timings) the component suite route
 # can be requested before Dash has collected and registered JS/CSS paths which
@@ -59,6 +78,12 @@ def set_no_transform(response):
 app._generate_scripts_html()
 app._generate_css_dist_html()
 
+# Run Dash's first-request set-up (routing callback of the pages, callback map) now rather than on the first request:
+# with several threads per worker the first requests run it at the same time, and some of them then find their
+# callback missing ("Callback function not found for output ...").
+with server.test_request_context():
+    server.preprocess_request()
+
 # app.layout = html.Div([
     
     
@@ -83,4 +108,6 @@ app._generate_css_dist_html()
 
 
 if __name__ == '__main__':
+    if DATA_DIR:
+        start_watcher()
     app.run(debug=True)
\ No newline at end of file
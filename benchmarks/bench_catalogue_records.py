@@ -0,0 +1,127 @@
+'''
+Benchmark of the catalogue records used by the callbacks of the database page (utils/records.py).
+
+The callbacks used to get the selected rows as a list of dictionaries (DataFrame lookup + to_dict('records')) and
+then build a DataFrame from it again to read data_df['Datafile'][i] etc. Now they read the column arrays of the catalogue
+through Record objects. For every callback the row access it does is run both ways, for growing selections:
+
+- plot_selected_data (unsplit): Z, A, Datafile, Emin, Emax, Author and Isotope of every selected data set,
+- make_zip: the data file of every selected data set,
+- render_split_graph: one data set,
+- make_comparison_plots: data file, Z and A of every selected data set.
+
+It reports the time per call (timeit) and the peak of the memory allocated during one call (tracemalloc), and finally
+the time of the whole plot_selected_data callback (without fits) with the records.
+
+Run from the repository root:  python benchmarks/bench_catalogue_records.py
+'''
+
+import os
+import sys
+import timeit
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd
+from utils.catalogue import get_catalogue, selected_records
+
+
+SELECTION_SIZES = [1, 10, 50, 167]
+
+PLOT_COLUMNS = ['Z', 'A', 'Datafile', 'Emin', 'Emax', 'Author', 'Isotope']
+
+
+def dict_records(names):
+    '''The selected rows as the callbacks used to get them (list of dictionaries).'''
+
+    df = get_catalogue()
+    rows = df[df['Name'].isin(names or [])].set_index('Name', drop=False)
+
+    return rows.loc[[name for name in names if name in rows.index]].to_dict('records')
+
+
+def old_plot(names):
+    data_df = pd.DataFrame.from_dict(dict_records(names))
+    return [[data_df[column][i] for column in PLOT_COLUMNS] for i in range(len(data_df))]
+
+
+def new_plot(names):
+    return [[record[column] for column in PLOT_COLUMNS] for record in selected_records(names)]
+
+
+def old_zip(names):
+    data_df = pd.DataFrame.from_dict(dict_records(names))
+    selected_data_sets = data_df.iloc[list(range(len(data_df)))]['Datafile']
+    return [selected_data_sets[i] for i in range(len(data_df))]
+
+
+def new_zip(names):
+    return [record['Datafile'] for record in selected_records(names)]
+
+
+def old_split(names):
+    record = dict_records(names[:1])[0]
+    return [record[column] for column in PLOT_COLUMNS]
+
+
+def new_split(names):
+    record = selected_records(names[:1])[0]
+    return [record[column] for column in PLOT_COLUMNS]
+
+
+def old_compare(names):
+    return [(record['Datafile'], record['Z'], record['A']) for record in dict_records(names)]
+
+
+def new_compare(names):
+    return [(record['Datafile'], record['Z'], record['A']) for record in selected_records(names)]
+
+
+CALLBACKS = [('plot_selected_data', old_plot, new_plot), ('make_zip', old_zip, new_zip),
+             ('render_split_graph', old_split, new_split), ('make_comparison_plots', old_compare, new_compare)]
+
+
+def measure(function, names):
+    '''Function to get the time per call (s) and the peak of the memory allocated by one call (bytes).'''
+
+    function(names)
+    timer = timeit.Timer(lambda: function(names))
+    number, _ = timer.autorange()
+    seconds = min(timer.repeat(repeat=3, number=number)) / number
+
+    tracemalloc.start()
+    function(names)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return seconds, peak
+
+
+def main():
+    names = list(get_catalogue()['Name'])
+    selected_records(names)
+
+    print(f'{"callback":<22} {"selected":>8} {"old (us)":>10} {"new (us)":>10} {"speed-up":>9} {"old peak (kB)":>14} {"new peak (kB)":>14}')
+    for label, old, new in CALLBACKS:
+        for size in SELECTION_SIZES:
+            selection = names[:size]
+            assert old(selection) == new(selection)
+            old_seconds, old_peak = measure(old, selection)
+            new_seconds, new_peak = measure(new, selection)
+            print(f'{label:<22} {size:>8} {old_seconds * 1e6:>10.1f} {new_seconds * 1e6:>10.1f} {old_seconds / new_seconds:>8.0f}x '
+                  f'{old_peak / 1e3:>14.1f} {new_peak / 1e3:>14.1f}')
+
+    import app
+    from pages.search_Z_A import make_plots
+
+    for size in SELECTION_SIZES:
+        selection = names[:size]
+        rows = list(range(size))
+        seconds = min(timeit.repeat(lambda: make_plots(lambda progress: None, rows, 'log', 'Reset', 0, selected_records(selection), None),
+                                    repeat=3, number=1))
+        print(f'plot_selected_data (unsplit, no fit) with {size} data sets: {seconds * 1e3:.1f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+'''
+Payload benchmark of the HTTP caching and compression layer (utils/http_cache.py).
+
+Loads the database page, its javascript/css bundles and typical callback responses (table records, a figure
+with fits) through the Flask test client, and compares the transferred bytes without compression
+(what the website sent before), with gzip and with brotli. It also counts the bytes a returning visitor
+downloads, whose browser revalidates its cached copies with If-None-Match.
+
+Run from the repository root:  python benchmarks/bench_http_payload.py
+'''
+
+import os
+import re
+import sys
+import gzip
+import json
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.http_cache import brotli
+from benchmarks.payloads import table_payload, plot_payload
+
+
+def decoded(response):
+    '''Body of a response, decompressed if needed (the test client does not decompress).'''
+
+    encoding = response.headers.get('Content-Encoding')
+    if encoding == 'gzip':
+        return gzip.decompress(response.data)
+    if encoding == 'br':
+        return brotli.decompress(response.data)
+    return response.data
+
+
+def post_callback(client, payload, headers):
+    '''Posts a callback and, for background callbacks, polls until the result is available.'''
+
+    response = client.post('/_dash-update-component', json=payload, headers=headers)
+    body = json.loads(decoded(response))
+    if 'cacheKey' not in body:
+        return response
+
+    query = f"?cacheKey={body['cacheKey']}&job={body['job']}"
+    while True:
+        time.sleep(0.2)
+        response = client.post('/_dash-update-component' + query, json=payload, headers=headers)
+        if response.status_code == 200 and 'response' in json.loads(decoded(response)):
+            return response
+
+
+def main():
+    import app
+    from utils.catalogue import get_catalogue
+
+    client = app.server.test_client()
+    data = get_catalogue().to_dict('records')
+
+    html = client.get('/search-z-a').get_data(as_text=True)
+    resources = ['/search-z-a'] + [u for u in re.findall(r'(?:src|href)="(/[^"]+)"', html) if not u.startswith('//')]
+
+    encodings = {'identity': {}, 'gzip': {'Accept-Encoding': 'gzip'}, 'br': {'Accept-Encoding': 'br, gzip'}}
+
+    print(f"{'resource':<60}" + ''.join(f'{name:>12}' for name in encodings))
+
+    totals = dict.fromkeys(encodings, 0)
+    etags = {}
+    for url in resources:
+        sizes = []
+        for name, headers in encodings.items():
+            response = client.get(url, headers=headers)
+            sizes.append(len(response.data))
+            totals[name] += len(response.data)
+            etags[url] = response.headers.get('ETag')
+        print(f'{url[-60:]:<60}' + ''.join(f'{size:>12,}' for size in sizes))
+
+    for label, payload in [('callback: update_table (Oslo + Evaporation)', table_payload()),
+                           ('callback: plot 20 data sets, split, All Models', plot_payload([record['Name'] for record in data[:20]], 'All', split=True))]:
+        sizes = []
+        for name, headers in encodings.items():
+            response = post_callback(client, payload, headers)
+            sizes.append(len(response.data))
+            totals[name] += len(response.data)
+        print(f'{label:<60}' + ''.join(f'{size:>12,}' for size in sizes))
+
+    print(f"{'total':<60}" + ''.join(f'{totals[name]:>12,}' for name in encodings))
+
+    # returning visitor: every cached resource is revalidated (or not requested at all if it is immutable).
+    revalidated = 0
+    for url in resources:
+        response = client.get(url, headers={'Accept-Encoding': 'br, gzip', 'If-None-Match': etags[url] or ''})
+        revalidated += len(response.data)
+    print(f'returning visitor, page resources: {revalidated:,} bytes (304 Not Modified for unchanged resources)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,167 @@
+'''
+Micro-benchmarks of loading, fitting and rendering over the shipped data sets (the Accepted/ and Probation/ directories).
+
+- load: parsing every data file, and reading them from the data store once they are loaded,
+- fit: least squares fits of every data set per model (not cached), and one Bayesian (MCMC) fit,
+- render: the work of the callbacks of the database page -- a table page, the unsplit plot per fitting model and
+  selection size (including the JSON encoding of the response), the split grid and its figures, the comparison plots
+  and the zip file (csv files only).
+
+Every benchmark reports the first call (cold: fits are not cached yet, the cache directory is a fresh temporary one) and
+the best and mean of the following calls (warm). The results are stored in benchmarks/results/ and compared with the last
+stored run (see benchmarks/results.py).
+
+Run from the repository root:
+
+    python benchmarks/bench_micro.py                      # everything
+    python benchmarks/bench_micro.py --only fit --repeat 3
+    python benchmarks/bench_micro.py --compare 72a90b0    # compare with the stored run of that commit
+'''
+
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import warnings
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# a fresh cache, so the first calls are cold (the environment variable is read when utils/cache.py is imported).
+CACHE_DIR = os.environ.setdefault('NLD_CACHE_DIR', tempfile.mkdtemp(prefix='nld-bench-'))
+
+from benchmarks.payloads import FIT_MODES
+from benchmarks.results import save_results, load_run, compare_runs
+
+
+SUITE = 'micro'
+
+SHIPPED_DIRS = ('Accepted', 'Probation')
+
+SELECTION_SIZES = [1, 10, 50]
+
+MCMC_MODELS = ('CTM',)
+
+
+def no_progress(progress):
+    pass
+
+
+def measure(function, repeat):
+    '''Function to time the first call and repeat more calls of a function.
+    Output: dictionary with the time of the first call, the best and the mean of the others (s), and the number of calls.'''
+
+    start = time.perf_counter()
+    function()
+    first = time.perf_counter() - start
+
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+
+    return {'first_s': first, 'best_s': min(times, default=first), 'mean_s': sum(times) / len(times) if times else first,
+            'calls': 1 + repeat}
+
+
+def fit_all(rows, model):
+    '''Function to fit every data set (not cached). Output: number of fits that failed.'''
+
+    from utils.fits import fit_dataset
+
+    failed = 0
+    for row in rows:
+        try:
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore')
+                fit_dataset(row['Datafile'], model, float(row['Emin']), float(row['Emax']), int(row['A']))
+        except Exception:
+            failed += 1
+
+    return failed
+
+
+def benchmarks():
+    '''Function to list the benchmarks as (group, name, function, number of warm calls).'''
+
+    import app
+    from plotly.io.json import to_json_plotly
+    from pages import search_Z_A as page
+    from utils.catalogue import get_catalogue, selected_records
+    from utils.data_store import read_nld_file, load_nld_data, fit_window
+    from utils.mcmc import sample_posterior
+
+    df = get_catalogue()
+    shipped = df[df['Datafile'].str.split('/').str[0].isin(SHIPPED_DIRS)]
+    names = list(shipped['Name'])
+    rows = selected_records(names)
+
+    # the plots fit the data sets like the website does, so they are made of data sets with enough points in their
+    # fitting window for every model (the website shows an error for the others).
+    fittable = [row for row in rows if len(fit_window(*load_nld_data(row['Datafile']), row['Emin'], row['Emax'])[0]) > 3]
+
+    # data sets of nuclei with at least two data sets, for the comparison plots.
+    counts = shipped.groupby(['Z', 'A'])['Name'].transform('size')
+    compared = selected_records(list(shipped['Name'][counts >= 2])[:max(SELECTION_SIZES)])
+
+    yield 'load', f'read and parse {len(rows)} csv files', lambda: [read_nld_file(row['Datafile']) for row in rows], 1
+    yield 'load', f'data store, {len(rows)} data sets', lambda: [load_nld_data(row['Datafile']) for row in rows], 5
+
+    for model in ('CTM', 'BSFG', 'GC'):
+        yield 'fit', f'{model} fit of {len(rows)} data sets', lambda model=model: fit_all(rows, model), 1
+    for model in MCMC_MODELS:
+        yield 'fit', f'{model} MCMC fit of 1 data set', lambda model=model, row=rows[0]: sample_posterior(
+            row['Datafile'], model, row['Emin'], row['Emax'], row['A']), 0
+
+    table = (None, None, ['Oslo', 'Evaporation'], None, None, 0, 10, [], '', [])
+    yield 'render', 'table page', lambda: page.table_page(*table), 20
+    yield 'render', 'table page, sorted by Z', lambda: page.table_page(*table[:7], [{'column_id': 'Z', 'direction': 'desc'}], '', []), 20
+
+    for size in SELECTION_SIZES:
+        selection = fittable[:size]
+        indices = list(range(len(selection)))
+        for fit in FIT_MODES:
+            yield 'render', f'plot {size} data sets, unsplit, {fit}', lambda selection=selection, indices=indices, fit=fit: to_json_plotly(
+                page.make_plots(no_progress, indices, 'log', fit, 0, selection, None)), 2
+        yield 'render', f'plot {size} data sets, split grid', lambda selection=selection, indices=indices: to_json_plotly(
+            page.make_plots(no_progress, indices, 'log', 'All', 1, selection, None)), 2
+        yield 'render', f'split figures of {size} data sets, All', lambda selection=selection: [to_json_plotly(
+            page.make_split_figure(record, 'log', 'All')) for record in selection], 2
+        yield 'render', f'zip of {size} data sets (csv only)', lambda selection=selection, indices=indices: page.make_zip(
+            no_progress, indices, selection, [], True), 2
+
+    yield 'render', f'comparison of {len(compared)} data sets', lambda: to_json_plotly(page.make_comparison_plots(no_progress, compared, 'log')), 2
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Micro-benchmarks of loading, fitting and rendering over the shipped data sets.')
+    parser.add_argument('--only', nargs='*', default=['load', 'fit', 'render'], choices=['load', 'fit', 'render'], help='groups to run')
+    parser.add_argument('--repeat', type=int, default=None, help='number of warm calls per benchmark (default: per benchmark)')
+    parser.add_argument('--compare', default=None, metavar='COMMIT', help='stored run to compare with (default: the last one)')
+    parser.add_argument('--no-save', action='store_true', help='do not store the results')
+    args = parser.parse_args(argv)
+
+    results = {}
+    print(f'{"benchmark":<50} {"first (ms)":>11} {"best (ms)":>10} {"mean (ms)":>10}')
+    for group, name, function, repeat in benchmarks():
+        if group not in args.only:
+            continue
+        key = f'{group}: {name}'
+        results[key] = measure(function, repeat if args.repeat is None else args.repeat)
+        print(f'{key:<50} {results[key]["first_s"] * 1e3:>11.1f} {results[key]["best_s"] * 1e3:>10.1f} {results[key]["mean_s"] * 1e3:>10.1f}')
+
+    if not args.no_save:
+        print(f'\nresults written to {save_results(SUITE, results, {"groups": args.only})}')
+
+    regressions = compare_runs(load_run(SUITE, args.compare, exclude_current=not args.no_save), results, ['best_s'])
+
+    if CACHE_DIR.startswith(os.path.join(tempfile.gettempdir(), 'nld-bench-')):
+        shutil.rmtree(CACHE_DIR, ignore_errors=True)
+
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,314 @@
+'''
+Load test of the website: many simulated users posting callback requests to /_dash-update-component.
+
+By default the website is started with gunicorn and the options of the Dockerfile (workers and threads, bound to
+localhost, and its environment variables), with a fresh cache directory. NLD_DATA_DIR points to an empty temporary
+directory standing in for the mounted data volume (or to --data-dir), so the catalogue watcher runs as in production. Every simulated user (a thread) sends requests one after the other, each
+one as the browser would: the payloads of benchmarks/payloads.py, and for the background callbacks (plots and zip
+files) the polling until the result is ready. The split-graphs scenario also requests the graphs of the first batch
+of the split grid, all at once like the browser, and waits until every graph is there. The selections are drawn from a fixed pool of random selections of the
+shipped data sets, so some requests are cache hits and some are not, as on the real website.
+
+For every scenario and number of users it reports the throughput and the p50/p90/p99 latency, stores the results in
+benchmarks/results/ and compares them with the last stored run (see benchmarks/results.py).
+
+Run from the repository root:
+
+    python benchmarks/load_test.py                                   # all scenarios with 1, 4 and 16 users
+    python benchmarks/load_test.py --scenarios table plot-CTM --users 8 --duration 30
+    python benchmarks/load_test.py --url http://localhost:8050      # a server that is already running
+    python benchmarks/load_test.py --data-dir /srv/nld-db           # with a copy of the data volume
+'''
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.payloads import FIT_MODES, table_payload, plot_payload, split_graph_payload, zip_payload
+from benchmarks.results import save_results, load_run, compare_runs
+
+
+SUITE = 'load'
+
+SHIPPED_DIRS = ('Accepted', 'Probation')
+
+SCENARIOS = ['table'] + [f'plot-{fit}' for fit in FIT_MODES] + ['plot-split', 'split-graphs', 'compare', 'zip']
+
+# Number of data sets of the random selections.
+SELECTION_SIZES = [1, 2, 5, 10, 20]
+
+# Seconds between two polls of a background callback (the website polls every 0.5 s, see interval= in pages/search_Z_A.py).
+POLL_INTERVAL = 0.5
+
+# Simultaneous requests of a browser to the same host (the graphs of a split grid are requested at once).
+BROWSER_CONNECTIONS = 6
+
+# Seconds a single request (with its polling) may take before it counts as an error.
+REQUEST_TIMEOUT = 60
+
+
+def dockerfile_lines(instruction):
+    '''Function to get the arguments of the lines of the Dockerfile with an instruction (e.g. CMD or ENV).'''
+
+    with open(os.path.join(ROOT, 'Dockerfile')) as f:
+        return [line[len(instruction):].strip() for line in f if line.startswith(instruction + ' ')]
+
+
+def gunicorn_command(port):
+    '''Function to get the gunicorn command of the Dockerfile, bound to localhost:port instead of port 80.'''
+
+    command = dockerfile_lines('CMD')[-1]
+
+    args = [arg.strip() for arg in json.loads(command)]
+    args = [arg for arg in args[1:] if not (arg.startswith('-b') or arg.startswith('--bind'))]
+
+    return [sys.executable, '-m', 'gunicorn', f'--bind=127.0.0.1:{port}'] + args
+
+
+def dockerfile_env():
+    '''Function to get the environment variables set by the Dockerfile (ENV KEY=VALUE lines).'''
+
+    return dict(item.split('=', 1) for line in dockerfile_lines('ENV') for item in line.split())
+
+
+def start_server(port, cache_dir, data_dir):
+    '''Function to start the website with gunicorn and wait until it answers.
+    Inputs: port, cache directory and data directory (NLD_DATA_DIR) of the website.
+    Output: the server process.'''
+
+    env = dict(os.environ, **dockerfile_env())
+    env.update(NLD_CACHE_DIR=cache_dir, NLD_DATA_DIR=data_dir)
+    process = subprocess.Popen(gunicorn_command(port), cwd=ROOT, env=env)
+
+    url = f'http://127.0.0.1:{port}'
+    deadline = time.time() + 120
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'gunicorn exited with code {process.returncode}')
+        try:
+            if requests.get(url + '/search-z-a', timeout=5).status_code == 200:
+                return process
+        except requests.RequestException:
+            # not listening yet, or the workers are still importing the app.
+            pass
+        time.sleep(0.5)
+
+    process.terminate()
+    raise RuntimeError('the server did not start within 120 s')
+
+
+def selection_pool(size, seed):
+    '''Function to draw random selections of the shipped data sets (with enough points in their fitting window for every model).
+    Output: list of (list of dataset IDs) and, for the comparison, list of selections of nuclei with several data sets.'''
+
+    from utils.catalogue import get_catalogue
+    from utils.data_store import load_nld_data, fit_window
+
+    df = get_catalogue()
+    df = df[df['Datafile'].str.split('/').str[0].isin(SHIPPED_DIRS)]
+    names = [row.Name for row in df.itertuples() if len(fit_window(*load_nld_data(row.Datafile), row.Emin, row.Emax)[0]) > 3]
+
+    rng = random.Random(seed)
+    selections = [rng.sample(names, min(rng.choice(SELECTION_SIZES), len(names))) for _ in range(size)]
+
+    nuclei = [list(group['Name']) for _, group in df.groupby(['Z', 'A']) if len(group) >= 2]
+    comparisons = [sum(rng.sample(nuclei, min(rng.choice([1, 2, 3]), len(nuclei))), []) for _ in range(size)]
+
+    return selections, comparisons
+
+
+def make_payload(scenario, rng, selections, comparisons):
+    '''Function to make the request of a scenario with a random selection (or table page).'''
+
+    if scenario == 'table':
+        methods = rng.sample(['Oslo', 'Evaporation', 'Ericson', 'Beta Oslo'], rng.randint(1, 4))
+        sort_by = rng.choice([None, [{'column_id': 'Z', 'direction': 'asc'}], [{'column_id': 'A', 'direction': 'desc'}]])
+        return table_payload(methods, page_current=rng.randint(0, 3), sort_by=sort_by)
+
+    if scenario == 'compare':
+        return plot_payload(rng.choice(comparisons), 'Reset', compare=True)
+
+    if scenario == 'zip':
+        return zip_payload(rng.choice(selections))
+
+    if scenario in ('plot-split', 'split-graphs'):
+        return plot_payload(rng.choice(selections), 'All', split=True)
+
+    return plot_payload(rng.choice(selections), scenario.split('-', 1)[1], scale=rng.choice(['log', 'linear']))
+
+
+def post_callback(session, url, payload):
+    '''Function to post a callback request like the browser, polling background callbacks until the result is ready.
+    Output: the answer of the callback (empty if nothing was updated), or None if the request failed.'''
+
+    response = session.post(url + '/_dash-update-component', json=payload, timeout=REQUEST_TIMEOUT)
+    if response.status_code != 200:
+        return {} if response.status_code == 204 else None
+
+    body = response.json()
+    if 'cacheKey' not in body:
+        return body if 'response' in body else None
+
+    query = f"?cacheKey={body['cacheKey']}&job={body['job']}"
+    deadline = time.time() + REQUEST_TIMEOUT
+    while time.time() < deadline:
+        time.sleep(POLL_INTERVAL)
+        response = session.post(url + '/_dash-update-component' + query, json=payload, timeout=REQUEST_TIMEOUT)
+        if response.status_code not in (200, 204):
+            return None
+        body = response.json() if response.status_code == 200 and response.content else {}
+        if 'response' in body:
+            return body
+        if any(key.endswith('callback_error') for key in body):
+            return None
+
+    return None
+
+
+def split_graph_requests(component):
+    '''Function to find the requests of the graphs (split-graph-request stores) in the split grid returned by the plot callback.
+    Output: list of (index, request).'''
+
+    if isinstance(component, list):
+        return [request for child in component for request in split_graph_requests(child)]
+    if not isinstance(component, dict):
+        return []
+
+    component_id = component.get('props', {}).get('id')
+    if isinstance(component_id, dict) and component_id.get('type') == 'split-graph-request':
+        return [(component_id['index'], component['props']['data'])]
+
+    return [request for value in component.values() for request in split_graph_requests(value)]
+
+
+def post_split_graphs(session, url, payload, executor):
+    '''Function to request the split grid, then the graphs of its first batch (at the same time, as the browser does).
+    Output: True if the grid and all its graphs were received.'''
+
+    body = post_callback(session, url, payload)
+    graph_requests = split_graph_requests(body['response']) if body else []
+    if not graph_requests:
+        return False
+
+    graphs = executor.map(lambda request: post_callback(session, url, split_graph_payload(*request)), graph_requests)
+
+    return all(graph is not None for graph in graphs)
+
+
+def run_scenario(url, scenario, users, duration, selections, comparisons, seed):
+    '''Function to run one scenario with a number of simulated users for a number of seconds.
+    Output: dictionary with the number of requests and errors, the throughput (requests/s) and the latencies (s).'''
+
+    latencies, errors = [], [0]
+    lock = threading.Lock()
+    deadline = time.time() + duration
+
+    def user(k):
+        rng = random.Random(seed * 1000 + k)
+        session = requests.Session()
+        executor = ThreadPoolExecutor(BROWSER_CONNECTIONS)
+        while time.time() < deadline:
+            payload = make_payload(scenario, rng, selections, comparisons)
+            start = time.perf_counter()
+            try:
+                if scenario == 'split-graphs':
+                    ok = post_split_graphs(session, url, payload, executor)
+                else:
+                    ok = post_callback(session, url, payload) is not None
+            except requests.RequestException:
+                ok = False
+            latency = time.perf_counter() - start
+            with lock:
+                if ok:
+                    latencies.append(latency)
+                else:
+                    errors[0] += 1
+        executor.shutdown()
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=user, args=(k,)) for k in range(users)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    result = {'users': users, 'requests': len(latencies), 'errors': errors[0], 'throughput_rps': len(latencies) / elapsed}
+    if latencies:
+        p50, p90, p99 = np.percentile(latencies, [50, 90, 99])
+        result.update(p50_s=float(p50), p90_s=float(p90), p99_s=float(p99), max_s=float(max(latencies)))
+
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Load test of the callbacks of the website.')
+    parser.add_argument('--url', default=None, help='server to test (default: start gunicorn with the options of the Dockerfile)')
+    parser.add_argument('--port', type=int, default=8050, help='port of the started server')
+    parser.add_argument('--data-dir', default=None, help='NLD_DATA_DIR of the started server (default: an empty temporary directory)')
+    parser.add_argument('--scenarios', nargs='*', default=SCENARIOS, choices=SCENARIOS)
+    parser.add_argument('--users', nargs='*', type=int, default=[1, 4, 16], help='numbers of simultaneous users')
+    parser.add_argument('--duration', type=float, default=20, help='seconds per scenario and number of users')
+    parser.add_argument('--pool', type=int, default=50, help='number of different random selections')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--compare', default=None, metavar='COMMIT', help='stored run to compare with (default: the last one)')
+    parser.add_argument('--no-save', action='store_true', help='do not store the results')
+    args = parser.parse_args(argv)
+
+    selections, comparisons = selection_pool(args.pool, args.seed)
+
+    process, cache_dir, data_dir = None, None, None
+    url = args.url
+    if url is None:
+        cache_dir = tempfile.mkdtemp(prefix='nld-load-')
+        data_dir = args.data_dir or tempfile.mkdtemp(prefix='nld-data-')
+        process = start_server(args.port, cache_dir, data_dir)
+        url = f'http://127.0.0.1:{args.port}'
+
+    results = {}
+    try:
+        print(f'{"scenario":<16} {"users":>6} {"requests":>9} {"errors":>7} {"req/s":>8} {"p50 (ms)":>9} {"p90 (ms)":>9} {"p99 (ms)":>9}')
+        for scenario in args.scenarios:
+            for users in args.users:
+                result = run_scenario(url, scenario, users, args.duration, selections, comparisons, args.seed)
+                results[f'{scenario} x{users}'] = result
+                print(f'{scenario:<16} {users:>6} {result["requests"]:>9} {result["errors"]:>7} {result["throughput_rps"]:>8.1f} '
+                      + ''.join(f'{result[p] * 1e3:>9.0f} ' if p in result else f'{"-":>9} ' for p in ('p50_s', 'p90_s', 'p99_s')))
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+            shutil.rmtree(cache_dir, ignore_errors=True)
+            if args.data_dir is None:
+                shutil.rmtree(data_dir, ignore_errors=True)
+
+    settings = {'url': args.url or 'gunicorn (Dockerfile options)', 'data_dir': args.data_dir, 'duration': args.duration, 'pool': args.pool, 'seed': args.seed,
+                'poll_interval': POLL_INTERVAL}
+    if not args.no_save:
+        print(f'\nresults written to {save_results(SUITE, results, settings)}')
+
+    regressions = compare_runs(load_run(SUITE, args.compare, exclude_current=not args.no_save), results, ['p50_s', 'p99_s'])
+
+    # a failed request is a bug (a lost or hung background job, an exception in a callback), not a slow-down.
+    failed = [name for name, result in results.items() if result['errors']]
+    if failed:
+        print(f'\nrequests failed in: {", ".join(failed)}')
+
+    return 1 if regressions or failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
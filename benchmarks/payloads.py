@@ -0,0 +1,65 @@
+'''
+Request bodies of the callbacks of the database page, as the browser posts them to /_dash-update-component.
+
+Shared by the benchmarks: bench_http_payload.py sends them through the Flask test client, load_test.py to a running server.
+'''
+
+TABLE_OUTPUTS = ['data', 'page_count', 'page_current', 'selected_rows']
+
+# Values of the fitting radio buttons (utils/webpage_view.py); 'Reset' plots the data without fits, the _MCMC ones add the Bayesian fits.
+FIT_MODES = ['Reset', 'CTM', 'BSFG', 'GC', 'All', 'CTM_MCMC', 'BSFG_MCMC']
+
+
+def table_payload(methods=('Oslo', 'Evaporation'), page_current=0, sort_by=None, Z=None, A=None, page_size=10):
+    '''update_table: the search criteria, sorting and page of the data table.'''
+
+    return {'output': '..' + '...'.join(f'data_log_table.{prop}' for prop in TABLE_OUTPUTS) + '..',
+            'outputs': [{'id': 'data_log_table', 'property': prop} for prop in TABLE_OUTPUTS],
+            'inputs': [{'id': 'mass-number', 'property': 'value', 'value': A},
+                       {'id': 'proton-number', 'property': 'value', 'value': Z},
+                       {'id': 'method_btn', 'property': 'value', 'value': list(methods)},
+                       {'id': 'search_by_reaction', 'property': 'value', 'value': None},
+                       {'id': 'status_btn', 'property': 'value', 'value': None},
+                       {'id': 'data_log_table', 'property': 'page_current', 'value': page_current},
+                       {'id': 'data_log_table', 'property': 'page_size', 'value': page_size},
+                       {'id': 'data_log_table', 'property': 'sort_by', 'value': sort_by or []},
+                       {'id': 'data_log_table', 'property': 'filter_query', 'value': ''}],
+            'changedPropIds': ['data_log_table.page_current' if page_current else 'method_btn.value'],
+            'state': [{'id': 'selected-ids', 'property': 'data', 'value': []}]}
+
+
+def plot_payload(names, fit, split=False, scale='log', compare=False):
+    '''plot_selected_data (a background callback): the selected data sets, scale, fitting model, split/unsplit and compare mode.'''
+
+    return {'output': 'div-graphs.children', 'outputs': {'id': 'div-graphs', 'property': 'children'},
+            'inputs': [{'id': 'selected-ids', 'property': 'data', 'value': list(names)},
+                       {'id': 'radio_btn', 'property': 'value', 'value': scale},
+                       {'id': 'radio_btn_fitting', 'property': 'value', 'value': fit},
+                       {'id': 'split_unsplit_btn', 'property': 'n_clicks', 'value': 1 if split else 0},
+                       {'id': 'compare_btn', 'property': 'value', 'value': ['compare'] if compare else []}],
+            'changedPropIds': ['radio_btn_fitting.value'],
+            'state': [{'id': 'select_btn', 'property': 'value_select', 'value': None}]}
+
+
+def split_graph_payload(index, request):
+    '''render_split_graph (a background callback with a MATCH output): one graph of the split grid, requested by its
+    split-graph-request store (the data set, scale and fitting model, see split_graph_item in pages/search_Z_A.py).'''
+
+    return {'output': '{"index":["MATCH"],"type":"split-graph"}.children',
+            'outputs': {'id': {'type': 'split-graph', 'index': index}, 'property': 'children'},
+            'inputs': [{'id': {'type': 'split-graph-request', 'index': index}, 'property': 'data', 'value': request}],
+            'changedPropIds': [], 'state': []}
+
+
+def zip_payload(names, graphs=None, split=False, scale='log', fit='Reset', compare=False):
+    '''create_zip (a background callback): the selected data sets and the displayed graphs (without figures only the csv files are packed).'''
+
+    return {'output': 'download-data.data', 'outputs': {'id': 'download-data', 'property': 'data'},
+            'inputs': [{'id': 'download_btn', 'property': 'n_clicks', 'value': 1}],
+            'changedPropIds': ['download_btn.n_clicks'],
+            'state': [{'id': 'selected-ids', 'property': 'data', 'value': list(names)},
+                      {'id': 'div-graphs', 'property': 'children', 'value': graphs or []},
+                      {'id': 'split_unsplit_btn', 'property': 'n_clicks', 'value': 1 if split else 0},
+                      {'id': 'radio_btn', 'property': 'value', 'value': scale},
+                      {'id': 'radio_btn_fitting', 'property': 'value', 'value': fit},
+                      {'id': 'compare_btn', 'property': 'value', 'value': ['compare'] if compare else []}]}
@@ -0,0 +1,108 @@
+'''
+Stored benchmark results, so that performance regressions are visible between commits.
+
+Every run of bench_micro.py or load_test.py is written to benchmarks/results/<suite>-<commit>.json together with the
+commit, the time and the machine it ran on. After a run the results are compared with the last stored run of the same
+suite from another commit (or with the commit given by --compare), and benchmarks that got more than REGRESSION_THRESHOLD
+slower are marked. Only runs on the same machine can be compared meaningfully.
+'''
+
+import os
+import sys
+import glob
+import json
+import platform
+import subprocess
+from datetime import datetime, timezone
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+RESULTS_DIR = os.path.join(ROOT, 'benchmarks', 'results')
+
+# Relative slow-down from which a benchmark is reported as a regression.
+REGRESSION_THRESHOLD = 0.2
+
+
+def git_commit():
+    '''Function to get the short hash of the checked out commit (with "-dirty" if the website has uncommitted changes).'''
+
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+        # changes of the benchmarks themselves do not change what is measured.
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no', '--', ':(exclude)benchmarks'], cwd=ROOT,
+                               capture_output=True, text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+    return commit + ('-dirty' if dirty else '')
+
+
+def save_results(suite, results, settings=None):
+    '''Function to store the results of a run.
+    Inputs: name of the suite, {benchmark: {metric: value}}, settings of the run (e.g. number of clients).
+    Output: path of the results file.'''
+
+    commit = git_commit()
+    run = {
+        'suite': suite,
+        'commit': commit,
+        'time': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'machine': {'python': platform.python_version(), 'platform': platform.platform(), 'processor': platform.processor(),
+                    'cpus': os.cpu_count()},
+        'settings': settings or {},
+        'results': results,
+    }
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    path = os.path.join(RESULTS_DIR, f'{suite}-{commit}.json')
+    with open(path, 'w') as f:
+        json.dump(run, f, indent=1)
+
+    return path
+
+
+def load_run(suite, commit=None, exclude_current=True):
+    '''Function to load a stored run: the one of the given commit, or the newest one (of another commit than the current one
+    if exclude_current, i.e. when the current run has just been stored).
+    Output: the run (dictionary), or None if there is none.'''
+
+    if commit:
+        paths = glob.glob(os.path.join(RESULTS_DIR, f'{suite}-{commit}*.json'))
+    else:
+        current = os.path.join(RESULTS_DIR, f'{suite}-{git_commit()}.json')
+        paths = [path for path in glob.glob(os.path.join(RESULTS_DIR, f'{suite}-*.json')) if not (exclude_current and path == current)]
+
+    runs = []
+    for path in paths:
+        with open(path) as f:
+            runs.append(json.load(f))
+
+    return max(runs, key=lambda run: run['time']) if runs else None
+
+
+def compare_runs(previous, results, metrics, file=sys.stdout):
+    '''Function to print the change of some metrics (lower is better, e.g. times or latencies) against a previous run.
+    Output: list of the (benchmark, metric) that got slower by more than REGRESSION_THRESHOLD.'''
+
+    if previous is None:
+        print('no previous run to compare with', file=file)
+        return []
+
+    regressions = []
+    for metric in metrics:
+        print(f'\ncompared with {previous["commit"]} ({previous["time"]}), {metric}:', file=file)
+
+        for name, values in results.items():
+            before = previous['results'].get(name, {}).get(metric)
+            now = values.get(metric)
+            if not before or now is None:
+                continue
+            change = now / before - 1
+            flag = ''
+            if change > REGRESSION_THRESHOLD:
+                regressions.append((name, metric))
+                flag = '  <-- regression'
+            print(f'  {name:<50} {before:>12.4g} -> {now:>12.4g}  {change:+7.1%}{flag}', file=file)
+
+    return regressions
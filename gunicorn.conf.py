@@ -0,0 +1,15 @@
+'''
+gunicorn settings of the website (see the CMD of the Dockerfile).
+'''
+
+
+def post_worker_init(worker):
+    '''Function to start the hot reload of the catalogue and the data files (utils/watcher.py) in a worker, once it has
+    loaded the app. It is not started when app.py is imported: the background jobs are forked from a process that imports
+    app.py as well (see utils/cache.py), and a thread running there would leave its locks held in the jobs.'''
+
+    from utils.catalogue import DATA_DIR
+    from utils.watcher import start_watcher
+
+    if DATA_DIR:
+        start_watcher()
@@ -19,14 +19,13 @@ along with this program. If not, see <https://www.gnu.org/licenses/>.
 import dash
 from dash import html, dcc, callback, Input, Output
 import pandas as pd 
+from utils.catalogue import get_catalogue
 
 dash.register_page(__name__, path='/',title='Home',name='Home')
 
-# Load the main file that has information about all data sets.
-df_NLD = pd.read_excel('log_book_new.xlsx')
-
-# layout of the homepage.
-layout = html.Div([
+# layout of the homepage. It is a function, so every visit gets the current catalogue (it is reloaded when data sets are added, see utils/watcher.py).
+def layout(**kwargs):
+  return html.Div([
 	# We need a main heading.
 	html.A(html.H1('Current Archive of Nuclear Density of Levels',className='website_header'),href='/',className='header_banner_link'),
 
@@ -49,6 +48,12 @@ layout = html.Div([
     # A clickable button that takes you to the database.
     html.Div(html.A(html.Button('Go to Database', id='go_to_database_btn',className='database-btn'),href='/search-z-a'),className='database-btn-container'),
 
+    # Overview of all nuclei in the archive (see pages/nuclide_chart.py).
+    html.Div(html.A(html.Button('Nuclide Chart', id='go_to_nuclide_chart_btn',className='database-btn'),href='/nuclide-chart'),className='database-btn-container'),
+
+    # The whole archive (catalogue, data and fits) in one file (see utils/export.py).
+    html.Div(html.A(html.Button('Download Whole Archive', id='download_archive_btn',className='database-btn'),href='/downloads/nld_archive.npz'),className='database-btn-container'),
+
     html.P(['If you would like to submit your dataset to this database or if you would like to inquire about an available dataset, please forward \
     	your queries to ',html.A('The Level Density Group', href='mailto:theleveldensitygroup@gmail.com',style={'color':'orange'})],
         className='contact-info-section'),
@@ -57,7 +62,7 @@ layout = html.Div([
     # To store the entire main log file (without displaying it on the webpage.)
     
 
-    dcc.Store(id='full-data-store',data=df_NLD.to_dict('records'))
+    dcc.Store(id='full-data-store',data=get_catalogue().to_dict('records'))
 ])
 
 # callback function that takes in the main file and returns the number of available dataset.
@@ -0,0 +1,79 @@
+'''
+This file is part of The Level Density project website (www.nld.ascsn.net).
+
+The Level Density project website is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+The Level Density project website is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+'''
+
+import dash
+from dash import html, dcc, callback, Input, Output
+import dash_bootstrap_components as dbc
+from utils.nuclide_chart import QUANTITIES, chart_figure, chart_aggregates
+
+dash.register_page(__name__, path='/nuclide-chart', title='Nuclide chart', name='Nuclide chart')
+
+# Overview of the archive: one cell per nucleus (Z vs N), colored by the number of data sets or a mean fit parameter.
+# The aggregates and the figures are computed once per catalogue version (see utils/nuclide_chart.py), so the chart loads instantly.
+# Clicking a nucleus opens the database page with the data sets of that nucleus (pages/search_Z_A.py reads Z and A from the url).
+
+def layout(**kwargs):
+    return html.Div([
+        html.A(html.H1('Current Archive of Nuclear Density of Levels',className='website_header_database'),href='/',className='header_banner_link_database'),
+        html.Hr(id='banner_hr'),
+
+        html.P('Click on a nucleus to see its data sets.',className='intro_Z_A'),
+
+        html.Div(dbc.RadioItems(options=[{'label': title, 'value': quantity} for quantity, (_, title) in QUANTITIES.items()],
+            value='count',id='nuclide_chart_quantity',inline=True,switch=True),className='scaling-btn'),
+
+        dcc.Graph(id='nuclide_chart',figure=chart_figure('count'),config={'displaylogo': False}),
+
+        dcc.Location(id='nuclide_chart_url',refresh='callback-nav'),
+    ])
+
+
+@callback(
+    Output('nuclide_chart','figure'),
+    Input('nuclide_chart_quantity','value'),prevent_initial_call=True)
+
+def update_nuclide_chart(quantity):
+    '''Function to color the nuclide chart by the quantity the user selects.
+    Input: quantity - number of data sets, CT temperature or BSFG level density parameter.
+    Output: the chart.'''
+
+    return chart_figure(quantity)
+
+
+@callback(
+    Output('nuclide_chart_url','href'),
+    Input('nuclide_chart','clickData'),prevent_initial_call=True)
+
+def open_nucleus(click_data):
+    '''Function to open the database page filtered to the nucleus the user clicked on.
+    Input: click_data - the clicked cell (x = N, y = Z).
+    Output: the url of the database page with Z and A.'''
+
+    if not click_data:
+        return dash.no_update
+
+    point = click_data['points'][0]
+    Z, N = int(point['y']), int(point['x'])
+
+    # cells without data sets are empty, nothing to open.
+    aggregates = chart_aggregates()
+    i, j = Z - aggregates['Z'][0], N - aggregates['N'][0]
+    if not (0 <= i < len(aggregates['Z']) and 0 <= j < len(aggregates['N'])) or aggregates['count'][i, j] == 0:
+        return dash.no_update
+
+    return f'/search-z-a?Z={Z}&A={Z + N}'
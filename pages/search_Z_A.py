@@ -22,15 +22,23 @@ import plotly.graph_objects as go
 import pandas as pd 
 import numpy as np
 #import dash_bootstrap_components as dbc
-#from plotly.subplots import make_subplots
+from plotly.subplots import make_subplots
 import io
+import json
 import base64
+import hashlib
+import urllib.parse
 import zipfile
 from scipy.optimize import curve_fit
 #from dash.exceptions import PreventUpdate
 from utils.webpage_view import *
 from utils.fitting_functions import *
-import re
+from utils.data_store import load_nld_data
+from utils.comparison import interpolated_datasets, compare_datasets
+from utils.fits import cached_fit
+from utils.mcmc import posterior_summary
+from utils.cache import single_flight
+from utils.catalogue import get_catalogue, query_catalogue, selected_records, reaction_index, resolve_path, catalogue_version
 
 
 ''' -------------------------------------------- Table of Contents --------------------------------------------------
@@ -48,9 +56,7 @@ import re
 # Register the page name. If you change this, then you will have to change the name in home.py (href in id = go_to_database_btn)
 dash.register_page(__name__,title='Search by Z and A',name='Search by Z and A')
 
-# load the main log file.
-df_NLD = pd.read_excel('log_book_new.xlsx')
-df_NLD.dropna(subset=['Datafile'],inplace=True)
+# The main log file is loaded (and reloaded when it changes) by utils/catalogue.py. Always use get_catalogue() to get the current version.
 
 # By default Plotly displays a blank plotting area on the webpage. This function is made to avoid displaying that once the webpage is loaded.
 
@@ -67,11 +73,14 @@ def blank_figure():
     return fig
 
 # The layout of this webpage is described in utils/webpage_view.py
-layout = html.Div(children=[
-    dcc.Location(id='url'),
-    html.Div(id='page-content'),
-    dcc.Store(id='full-data-store',data=df_NLD.to_dict('records'))
-])
+def layout(**kwargs):
+    return html.Div(children=[
+        dcc.Location(id='url'),
+        html.Div(id='page-content'),
+        # IDs (the Name column) of the selected data sets, in the order they were selected. The table only holds one page,
+        # so the selection is kept here and not in the table (see update_selection).
+        dcc.Store(id='selected-ids',data=[])
+    ])
 
 
 
@@ -79,14 +88,24 @@ layout = html.Div(children=[
 # This callback takes in the pathname of the database and outputs the webpage view.
 @callback(
     Output('page-content','children'),
-    [Input('url','pathname')]
+    [Input('url','pathname')],
+    State('url','search')
     )
-def display_page(pathname):
+def display_page(pathname, search):
     '''Function to display the webpage.
-    Input: the pathname (location) of the webpage.
+    Inputs: the pathname (location) of the webpage, its query string. A nucleus can be given in the query string
+    (e.g. ?Z=26&A=57, see pages/nuclide_chart.py), then the page opens with the data sets of that nucleus.
     Output: The webpage view.'''
 
-    out = view() # The webpage layout is stored in a function called view() in utils/webpage_view.py. The entire file is imported on Line 13.
+    query = urllib.parse.parse_qs((search or '').lstrip('?'))
+    try:
+        Z, A = int(query['Z'][0]), int(query['A'][0])
+    except (KeyError, ValueError):
+        Z, A = None, None
+
+    table = table_page(A, Z, None, None, None, 0, TABLE_PAGE_SIZE, [], '', []) if Z is not None else None
+
+    out = view(Z, A, table) # The webpage layout is stored in a function called view() in utils/webpage_view.py. The entire file is imported on Line 13.
     return out
 
 # ------------------------------------------------- 2.0) Inputs for Z & A --------------------------------------------------
@@ -108,62 +127,121 @@ def update_Z_dropdown(value):
     # Sort the mass numbers in ascending order using .sort_values(). The proton numbers are also arranged in ascending order (see utils/webpage_view.py)
     # There might be multiple datasets for same Z and A. We don't want that repititon to appear in the dropdown menu. Hence we use .unique()
 
+    df_NLD = get_catalogue()
+
     return df_NLD['A'][df_NLD['Z'] == value].sort_values().unique()
 
 
+# ------------------------------------------------- 2.1) Reaction suggestions --------------------------------------------------
+
+# The reaction dropdown does not ship every reaction with the page. While the user types, the matching reactions are
+# looked up in the reaction search index (see utils/reaction_index.py), the most common ones first.
+
+MAX_REACTION_OPTIONS = 20
+
+@callback(
+    Output('search_by_reaction','options'),
+    Input('search_by_reaction','search_value'),
+    State('search_by_reaction','value')
+)
+
+def update_reaction_options(search_value, value):
+    '''Function to suggest reactions for what the user typed in the reaction dropdown.
+    Inputs: search_value - the text typed so far, value - the selected reaction (it stays in the options).
+    Output: the options of the dropdown.'''
+
+    reactions = reaction_index().suggest(search_value, limit=MAX_REACTION_OPTIONS)
+
+    if value and value not in reactions:
+        reactions = [value] + reactions
+
+    return [{'label': reaction, 'value': reaction} for reaction in reactions]
+
+
 # ------------------------------------------------- 3.0) Display data table based on Z & A --------------------------------------------------
 
 # Callback that takes in a particular Z, A and shows the available data sets with that Z and A.
+# The table uses custom paging, sorting and filtering: the rows are filtered and sorted on the server (see query_catalogue in
+# utils/catalogue.py) and only the page that is displayed is sent to the browser, so the payload does not grow with the catalogue.
 # The allow_duplicate = True option, allows for the same output to be used in multiple callbacks.
 # By default all callbacks are triggered one after the another. Setting prevent_initial_call = True 
 # prevents certain callbacks to be triggered from the beginning.
 
 @callback(
-    [Output('data_log_table', 'data'),Output('full-data-store','data')],
+    [Output('data_log_table', 'data'),Output('data_log_table', 'page_count'),Output('data_log_table', 'page_current'),
+     Output('data_log_table', 'selected_rows')],
     [Input('mass-number', 'value'),
      Input('proton-number', 'value'),
      Input('method_btn', 'value'),
      Input('search_by_reaction', 'value'),
-     Input('status_btn', 'value')],
+     Input('status_btn', 'value'),
+     Input('data_log_table', 'page_current'),
+     Input('data_log_table', 'page_size'),
+     Input('data_log_table', 'sort_by'),
+     Input('data_log_table', 'filter_query')],
+    State('selected-ids', 'data'),
     prevent_initial_call=True
 )
-def update_table(A, Z, value_method, value_reaction, value_status):
-    # Start with the full dataset
-    filtered_df = df_NLD.copy()
-    full_data_store = df_NLD.copy()
+def update_table(A, Z, value_method, value_reaction, value_status, page_current, page_size, sort_by, filter_query, selected_ids):
+    '''Function to display one page of the data sets that match the search criteria.
+    Inputs: search criteria, page number, number of rows per page, sorting and filter row of the table, IDs of the selected data sets.
+    Outputs: the rows of the page, the number of pages, the page number and the selected rows of the page.'''
 
-    
-    # return nothing if nothing is chosen by the user.
-    # if A is None or Z is None and value_method is None and value_reaction is None and value_status is None:
-    #     return [],[]
-    # Apply filters based on inputs if they are not None
-    if A is not None and Z is not None:
-        filtered_df = filtered_df[(filtered_df['A'] == A) & (filtered_df['Z'] == Z)]
-        full_data_store = full_data_store[(full_data_store['A'] == A) & (full_data_store['Z'] ==Z)]
-        
-    
-    if value_method:
-        filtered_df = filtered_df[filtered_df['Method'].isin(value_method)]
-        full_data_store = full_data_store[full_data_store['Method'].isin(value_method)]
-
-    if value_reaction:
-        value_reaction = re.sub(r'\s+|\(|\)', '', value_reaction).lower()
-        filtered_df = filtered_df[filtered_df['Reaction'].str.replace(r'\s+|\(|\)', '', regex=True).str.lower().str.contains(value_reaction,na=False)]
-        full_data_store = full_data_store[full_data_store['Reaction'].str.replace(r'\s+|\(|\)', '', regex=True).str.lower().str.contains(value_reaction,na=False)]
-
-    if value_status:
-        filtered_df = filtered_df[filtered_df['Status'].isin(value_status)]
-        full_data_store = full_data_store[full_data_store['Status'].isin(value_status)]
-    
-    filtered_df =  filtered_df.reset_index()
+    # new search criteria, sorting or filter: go back to the first page.
+    if dash.ctx.triggered_id != 'data_log_table' or 'data_log_table.page_current' not in dash.ctx.triggered_prop_ids:
+        page_current = 0
 
-    full_data_store =  full_data_store.reset_index()
+    return table_page(A, Z, value_method, value_reaction, value_status, page_current, page_size, sort_by, filter_query, selected_ids)
 
 
-    columns_to_hide = ['ID','Exrange','Datafile', 'Author','Distance','Status','Deformation','Comments']
-    visible_df = filtered_df.drop(columns_to_hide, axis=1)
-    
-    return [visible_df.to_dict('records'),full_data_store.to_dict('records')]
+def table_page(A, Z, value_method, value_reaction, value_status, page_current, page_size, sort_by, filter_query, selected_ids):
+    '''Function to get one page of the data sets that match the search criteria (see update_table).
+    Outputs: the rows of the page, the number of pages, the page number and the selected rows of the page.'''
+
+    # Z and A are only used once both of them are chosen.
+    if A is None or Z is None:
+        A, Z = None, None
+
+    filtered_df = query_catalogue(Z=Z, A=A, methods=value_method, reaction=value_reaction, statuses=value_status,
+                                  sort_by=sort_by, filter_query=filter_query)
+
+    page_count = max(1, -(-len(filtered_df) // page_size))
+    page_current = min(page_current or 0, page_count - 1)
+
+    page_df = filtered_df.iloc[page_current * page_size:(page_current + 1) * page_size]
+
+    # the Name of a data set is its ID (the table reports selected_row_ids with it).
+    records = page_df[TABLE_COLUMNS].assign(id=page_df['Name']).to_dict('records')
+
+    selected = set(selected_ids or [])
+    selected_rows = [k for k, record in enumerate(records) if record['id'] in selected]
+
+    return [records, page_count, page_current, selected_rows]
+
+
+@callback(
+    Output('selected-ids', 'data'),
+    Input('data_log_table', 'selected_row_ids'),
+    [State('data_log_table', 'data'), State('selected-ids', 'data')],
+    prevent_initial_call=True
+)
+def update_selection(selected_row_ids, data, selected_ids):
+    '''Function to keep the IDs of the selected data sets across pages.
+    The table only knows the selected rows of the page it shows, so only the selection of those rows is updated.
+    Inputs: IDs of the selected rows of the page, rows of the page, IDs of all selected data sets.
+    Output: the new IDs of all selected data sets (in the order they were selected).'''
+
+    page_ids = {record['id'] for record in data or []}
+    selected_row_ids = [i for i in selected_row_ids or [] if i in page_ids]
+    selected_ids = selected_ids or []
+
+    new_ids = [i for i in selected_ids if i not in page_ids or i in selected_row_ids]
+    new_ids += [i for i in selected_row_ids if i not in selected_ids]
+
+    if new_ids == selected_ids:
+        return dash.no_update
+
+    return new_ids
 
 
 # ------------------------------------------------- 2) Display radio buttons after data selection --------------------------------------------------
@@ -191,23 +269,33 @@ def trigger_select_btn(data):
 
         return {'display': 'none'}
 
-@callback(Output('data_log_table','derived_virtual_selected_rows'),
+@callback([Output('selected-ids','data',allow_duplicate=True),Output('data_log_table','selected_rows',allow_duplicate=True)],
 	Input('select_btn','value'),
-	State('data_log_table','data'),prevent_initial_call=True)
+	[State('mass-number', 'value'),State('proton-number', 'value'),State('method_btn', 'value'),State('search_by_reaction', 'value'),
+	State('status_btn', 'value'),State('data_log_table', 'sort_by'),State('data_log_table', 'filter_query'),
+	State('data_log_table','data')],prevent_initial_call=True)
 
-def select_deselect_data(value, data):
+def select_deselect_data(value, A, Z, value_method, value_reaction, value_status, sort_by, filter_query, data):
+	'''Function to select (or deselect) all the data sets that match the search criteria, on every page of the table.
+	The IDs are looked up on the server, the browser only has the rows of one page.'''
 
 	if value:
-		return list(range(len(data)))
+		if A is None or Z is None:
+			A, Z = None, None
+
+		filtered_df = query_catalogue(Z=Z, A=A, methods=value_method, reaction=value_reaction, statuses=value_status,
+			sort_by=sort_by, filter_query=filter_query)
+
+		return [filtered_df['Name'].tolist(), list(range(len(data or [])))]
 
 	else:
-		return []
+		return [[], []]
 		
 
 # callbacks to show the radio buttons after data has been selected.
 @callback(
     Output('radio_btn','style'),
-    Input('data_log_table','derived_virtual_selected_rows'))
+    Input('selected-ids','data'))
 
 
 def trigger_log_btn(selected_data):
@@ -231,7 +319,7 @@ def trigger_log_btn(selected_data):
 
 @callback(
     Output('radio_btn_fitting','style'),
-    Input('data_log_table','derived_virtual_selected_rows'))
+    Input('selected-ids','data'))
 
 
 def trigger_fit_btn(selected_data):
@@ -252,233 +340,178 @@ def trigger_fit_btn(selected_data):
         return {'display': 'none'}
 
 @callback(
-    [Output('split_unsplit_btn','style'),Output('deselect_btn','style')],
-    Input('data_log_table','derived_virtual_selected_rows'),prevent_initial_call=True)
+    [Output('split_unsplit_btn','style'),Output('deselect_btn','style'),Output('compare_btn','style')],
+    Input('selected-ids','data'),prevent_initial_call=True)
 
 
 def trigger_split_btn(selected_data):
     '''By default, all the selected data sets are shown on 1 plot. So, I added a Split/Unsplit functionality
     if the user wants to see the data sets plotted in different figures (1 dataset per figure).
     This function shows the Split/Unsplit button after at least 2 data sets have been selected (doesn't make sense to split 1 dataset :)).
+    The same goes for the comparison of data sets.
 
     INPUTS: selected_data -- self-explanatory :)
-    OUTPUTS: The Split/Unsplit button.'''
+    OUTPUTS: The Split/Unsplit button, the Reset button and the Compare switch.'''
 
     if len(selected_data) > 1:
 
-        return {'display': 'block'},{'display':'inline'}
+        return {'display': 'block'},{'display':'inline'},{'display': 'block'}
 
     else:
 
-        return {'display': 'none'},{'display': 'none'}
+        return {'display': 'none'},{'display': 'none'},{'display': 'none'}
 
 
 
 # ---------------------------------------------------- 3) Main Functions ------------------------------------
 
-# callback to display the figures and the fits
-# Input 1: selected data sets from data table -- Input('data_log_table','derived_virtual_selected_rows')
-# Input 2: whether you want to see the data in Log scale or Linear scale -- Input('radio_btn','value') -- default is linear scale
-# Input 3: To which model (CT or BSFG or both) would you like to fit the data -- Input('radio_btn_fitting','value') -- default is none
-# Input 4: whether you want to see the plots in Split/Unsplit version -- Input('split_unsplit_btn','n_clicks')
-# State takes any output from previous callbacks and keeps it (without changing it) -- store the full log of the available data sets.
-# Output: graphs of level densities.
-
-@callback(
-    Output('div-graphs', 'children'),
-    [Input('data_log_table','derived_virtual_selected_rows'),Input('radio_btn','value'),Input('radio_btn_fitting','value'),
-    Input('split_unsplit_btn','n_clicks')],
-    [State('full-data-store','data'),State('select_btn','value_select')],prevent_initial_call=True)
-
-
-def plot_selected_data(derived_virtual_selected_rows,value,value_fit,n_clicks,data,value_select):
-    '''Function to display plots of level density data sets based on user selection.
-    Inputs: user selected data sets, choice of linear/log scale, choice of fitting model(s), 
-    checkpoint to see if Split/Unsplit button was clicked, full data store.
-    Outputs: Plots of level density data (in split or unsplit version).'''
-
-    # blank_figure() function was defined at the beginning of this document.
-    fig = blank_figure()
-
-    # a list to store the splitted plots.
-    split_plots = []
-    
-    # If and only if the user selects some data set in the table
-    if derived_virtual_selected_rows and data or value_select:
-
-
-        # by default all plots are unsplit. By default, n_clicks value has been set to 0 (even). 
-        #So, if n_clicks (number of clicks on the split/unsplit button) is an odd integer, that would mean 
-        # the program needs to split the plots.
-        split = (n_clicks % 2 == 1) 
-
-        # convert dictionary to pandas dataframe.
-        data_df = pd.DataFrame.from_dict(data)
-        graphs = []
-
-        # if the user selects to split the graphs
-        if split:
-
-            # extract information about the nucleus from the selected rows.
-            for i in derived_virtual_selected_rows:
-                fig = blank_figure()
-                Z = data_df['Z'][i]
-                A = data_df['A'][i]
-                datafile = data_df['Datafile'][i]
-
-                # minimum and maximum energy of fitting.
-                E_min = data_df['Emin'][i]
-                E_max = data_df['Emax'][i]
-
-                # location of csv data file.
-                #file_loc = '../OhioUniversity/PhD/NLDD/data_sets/' + datafile
-                nld_data = pd.read_csv(datafile,header=None,sep=',',comment='#')
-
-                if len(nld_data.columns != 3):
-                	nld_data[2] = 0.0
-
-                nld_data[2] = nld_data[2].replace(np.nan,0.0)
-
-                # apply 20% error if error is listed as 0 or if it is missing
-                nld_data[2] = nld_data.apply(lambda row: 0.2 * row[1] if row.get(2, 0.0) == 0.0 else row.get(2, 0.0), axis=1)
-    
-
-                unnamed_cols = nld_data.filter(like='3').columns
-                if not unnamed_cols.empty:
-                    nld_data.drop(columns=unnamed_cols, inplace=True)
-
-                #nld_data.drop(3, axis=1, inplace=True)
-                nld_data.rename(columns={0: "E (MeV)", 1: "NLD", 2: "NLD uncertainity"}, inplace=True)
-                print(nld_data.columns.tolist())
-
-                fig.add_trace(go.Scatter(x=nld_data['E (MeV)'],y=nld_data['NLD'],error_y=dict(type='data',array=nld_data['NLD uncertainity']),mode='markers',
-                    name=f"{data_df['Author'][i]} - {data_df['Isotope'][i]}",showlegend=True))
-
-                fig.update_xaxes(showline=True,linecolor='orange',color='orange',title_font_color='orange', linewidth=2,mirror=True,
-                    showgrid=True,gridcolor='LightGray',showticklabels=True, title_text='E (MeV)')
-
-                if value == 'log':
-
-                    fig.update_yaxes(showline=True,type="log", linecolor='orange',color='orange',title_font_color='orange', linewidth=2,mirror=True,
-                    tickformat=".2e",dtick=0.5,showgrid=True,gridcolor='LightGray',showticklabels=True,title_text='NLD (1/MeV)')
-
-                else:
-
-                    fig.update_yaxes(showline=True,linecolor='orange',color='orange',title_font_color='orange', linewidth=2,mirror=True,
-                    showgrid=True,gridcolor='LightGray',showticklabels=True,tickformat=".2e",title_text='NLD (1/MeV)')
-
-                fig.update_layout(legend_font_color='white') # setting legend font color
-                
-                # fit the data according to the model(s) the user selects. 
-                if value_fit == 'CTM':
+def add_fit_traces(fig, value_fit, datafile, E_min, E_max, A):
+    '''Function to fit a data set to the model(s) selected by the user and add the fitted curves to a figure.
+    Inputs: figure, choice of fitting model(s), data file of the data set, minimum and maximum energy of fitting, mass number.
+    Output: None (the fitted curves are added to the figure).'''
 
-                    nld_data_fit = nld_data[(nld_data['E (MeV)'] > E_min) & (nld_data['E (MeV)'] < E_max+0.1)]
+    if value_fit not in ('CTM', 'BSFG', 'GC', 'All', 'CTM_MCMC', 'BSFG_MCMC'):
+        return
 
-                    x,y,dy = nld_data_fit['E (MeV)'],nld_data_fit['NLD'],nld_data_fit['NLD uncertainity']
+    # the least squares fits are cached per data set, model and fitting window (see utils/fits.py).
+    x_fit = np.linspace(E_min, E_max,100)
 
-                    dy = np.where(dy == 0, 0.2*y, dy)
-               
-                    popt, pcov = curve_fit(ctm_fitting, xdata=x,ydata=y,sigma=dy,absolute_sigma=True)
+    if value_fit in ('BSFG', 'All'):
 
-                    x_fit = np.linspace(E_min, E_max,100)
+        fit = cached_fit(datafile, 'BSFG', E_min, E_max, A)
+        popt, param_errors = list(fit['parameters'].values()), list(fit['errors'].values())
 
-                    y_fit = ctm_fitting(x_fit, *popt)
+        y_fit = bsfg_fitting(x_fit, *popt,A)
 
-                    param_errors = np.sqrt(np.diag(pcov))
+        fig.add_trace(go.Scatter(x=x_fit,y=y_fit,mode='lines',
+            name='a = {}, del = {}, <br> da = {}, ddel = {}'.format(np.round(popt[0],2),np.round(popt[1],2),np.round(param_errors[0],2),
+                np.round(param_errors[1],2))))
 
+    if value_fit in ('CTM', 'All'):
 
-                    fig.add_trace(go.Scatter(x=x_fit,y=y_fit,mode='lines',
-                        name='T = {}, E = {}, <br> dT = {}, dE = {}'.format(np.round(popt[0],2),np.round(popt[1],2),np.round(param_errors[0],2),
-                        np.round(param_errors[1],2))))
+        fit = cached_fit(datafile, 'CTM', E_min, E_max, A)
+        popt, param_errors = list(fit['parameters'].values()), list(fit['errors'].values())
 
-                    
+        y_fit = ctm_fitting(x_fit, *popt)
 
-                elif value_fit == 'BSFG':
+        fig.add_trace(go.Scatter(x=x_fit,y=y_fit,mode='lines',
+            name='T = {}, E = {}, <br> dT = {}, dE = {}'.format(np.round(popt[0],2),np.round(popt[1],2),np.round(param_errors[0],2),
+                np.round(param_errors[1],2))))
 
-                    nld_data_fit = nld_data[(nld_data['E (MeV)'] > E_min) & (nld_data['E (MeV)'] < E_max+0.1)]
+    if value_fit == 'GC':
 
-                    x,y,dy = nld_data_fit['E (MeV)'],nld_data_fit['NLD'],nld_data_fit['NLD uncertainity']
+        # Composite Gilbert-Cameron fit: CT below the matching energy Ex and BSFG above it (see utils/fitting_functions.py).
+        fit = cached_fit(datafile, 'GC', E_min, E_max, A)
+        popt, param_errors = list(fit['parameters'].values()), list(fit['errors'].values())
 
-                    dy = np.where(dy == 0, 0.2*y, dy)
-               
-                    # Prevent the fit from choosing a Delta that is >= all E (which makes rho=0).
-                    # Use a reasonable initial guess and bounds: a>0 and Delta < min(E)
-                    minE = np.min(x)
-                    p0 = [max(1e-6, A/8.0), minE/2.0]
-                    bounds = ([1e-6, -50.0], [1e3, minE - 1e-6])
-                    popt, pcov = curve_fit(lambda E, a, Delta: bsfg_fitting(E,a,Delta,A), xdata=x, ydata=y,
-                                            sigma=dy, absolute_sigma=True, p0=p0, bounds=bounds, maxfev=10000)
-                    
+        y_fit = gilbert_cameron_fitting(x_fit, *popt, A)
 
-                    x_fit = np.linspace(E_min, E_max,100)
+        fig.add_trace(go.Scatter(x=x_fit,y=y_fit,mode='lines',
+            name='T = {}, a = {}, del = {}, <br> dT = {}, da = {}, ddel = {}, <br> Ex = {}, E = {}'.format(np.round(popt[0],2),
+                np.round(popt[1],2),np.round(popt[2],2),np.round(param_errors[0],2),np.round(param_errors[1],2),
+                np.round(param_errors[2],2),np.round(fit['Ex'],2),np.round(fit['E0'],2))))
 
-                    y_fit = bsfg_fitting(x_fit,*popt,A)
+    if value_fit in ('CTM_MCMC', 'BSFG_MCMC'):
 
-                    param_errors = np.sqrt(np.diag(pcov))
+        # Bayesian fit (see utils/mcmc.py): median curve with the 68% credible band, parameters as median (+84th/-16th percentile).
+        summary = posterior_summary(datafile, value_fit.split('_')[0], E_min, E_max, A)
 
-                    
+        labels = {'T': 'T', 'E0': 'E', 'a': 'a', 'Delta': 'del'}
+        name = ', <br> '.join('{} = {} (+{}/-{})'.format(labels[param], np.round(stats['median'],2), np.round(stats['plus'],2),
+            np.round(stats['minus'],2)) for param, stats in summary['parameters'].items())
 
-                    fig.add_trace(go.Scatter(x=x_fit,y=y_fit,mode='lines',
-                        name='a = {}, del = {}, <br> da = {}, ddel = {}'.format(np.round(popt[0],2),np.round(popt[1],2),np.round(param_errors[0],2),
-                        np.round(param_errors[1],2))))
+        fig.add_trace(go.Scatter(x=summary['x_fit'],y=summary['y_low'],mode='lines',line=dict(width=0),showlegend=False,hoverinfo='skip'))
+        fig.add_trace(go.Scatter(x=summary['x_fit'],y=summary['y_high'],mode='lines',line=dict(width=0),fill='tonexty',
+            showlegend=False,hoverinfo='skip'))
+        fig.add_trace(go.Scatter(x=summary['x_fit'],y=summary['y_median'],mode='lines',name=name))
 
-                    
 
-                elif value_fit == 'All':
+# callback to display the figures and the fits
+# Input 1: IDs of the selected data sets -- Input('selected-ids','data')
+# Input 2: whether you want to see the data in Log scale or Linear scale -- Input('radio_btn','value') -- default is linear scale
+# Input 3: To which model (CT, BSFG, Gilbert-Cameron, CT+BSFG or a Bayesian CT/BSFG fit) would you like to fit the data -- Input('radio_btn_fitting','value') -- default is none
+# Input 4: whether you want to see the plots in Split/Unsplit version -- Input('split_unsplit_btn','n_clicks')
+# Input 5: whether you want to compare the data sets of the same nucleus -- Input('compare_btn','value')
+# State takes any output from previous callbacks and keeps it (without changing it).
+# Output: graphs of level densities.
 
-                    nld_data_fit = nld_data[(nld_data['E (MeV)'] > E_min) & (nld_data['E (MeV)'] < E_max+0.1)]
+# Fitting many data sets (e.g. "Select all" + "All Models") can take a while, so this callback runs as a background job
+# (see utils/cache.py) instead of blocking one of the web server threads. It reports its progress after every data set,
+# can be cancelled with the Cancel button, and the result of a job is cached so submitting the same job again is served immediately.
 
-                    x,y,dy = nld_data_fit['E (MeV)'],nld_data_fit['NLD'],nld_data_fit['NLD uncertainity']
+@callback(
+    Output('div-graphs', 'children'),
+    [Input('selected-ids','data'),Input('radio_btn','value'),Input('radio_btn_fitting','value'),
+    Input('split_unsplit_btn','n_clicks'),Input('compare_btn','value')],
+    State('select_btn','value_select'),prevent_initial_call=True,
+    background=True, interval=500,
+    progress=[Output('plot_progress','value'),Output('plot_progress','max')],
+    running=[(Output('plot_progress_container','style'),{'display':'flex'},{'display':'none'})],
+    cancel=[Input('cancel_plot_btn','n_clicks')])
 
-                    dy = np.where(dy == 0, 0.2*y, dy)
-               
-                    # BSFG fit with bounds and initial guess to avoid non-physical solutions
-                    minE = np.min(x)
-                    p0 = [max(1e-6, A/8.0), minE/2.0]
-                    bounds = ([1e-6, -50.0], [1e3, minE - 1e-6])
-                    popt_bsfg, pcov_bsfg = curve_fit(lambda E, a, Delta: bsfg_fitting(E,a,Delta,A), xdata=x, ydata=y,
-                                                     sigma=dy, absolute_sigma=True, p0=p0, bounds=bounds, maxfev=10000)
 
-                    x_fit = np.linspace(E_min, E_max,100)
+def plot_selected_data(set_progress,selected_ids,value,value_fit,n_clicks,value_compare,value_select):
+    '''Function to display plots of level density data sets based on user selection.
+    Identical requests that run at the same time (e.g. many users selecting the same nuclei) are computed only once
+    and share the result (see utils/singleflight.py).
+    Inputs: function to report the progress, IDs of the user selected data sets, choice of linear/log scale, choice of fitting model(s), 
+    checkpoint to see if Split/Unsplit button was clicked, whether the data sets are compared.
+    Outputs: Plots of level density data (in split or unsplit version, or the comparison plots).'''
 
-                    y_fit_bsfg = bsfg_fitting(x_fit, *popt_bsfg,A)
+    # the log book rows of the selected data sets, in the order they were selected.
+    data = selected_records(selected_ids)
+    derived_virtual_selected_rows = list(range(len(data)))
 
-                    param_errors_bsfg = np.sqrt(np.diag(pcov_bsfg))
+    if not (derived_virtual_selected_rows and data):
+        return make_plots(set_progress,derived_virtual_selected_rows,value,value_fit,n_clicks,data,value_select)
 
-                    
+    # every key ends with the version of the catalogue: the results are shared for a while (see utils/singleflight.py),
+    # and a reloaded log book row or data file must not be served from a result of the old data.
+    if value_compare:
+        key = ('compare', tuple(record['Datafile'] for record in data), value, catalogue_version())
+        return single_flight.do(key, make_comparison_plots, set_progress, data, value)
 
-                    fig.add_trace(go.Scatter(x=x_fit,y=y_fit_bsfg,mode='lines',
-                        name='a = {}, del = {}, <br> da = {}, ddel = {}'.format(np.round(popt_bsfg[0],2),np.round(popt_bsfg[1],2),
-                        np.round(param_errors_bsfg[0],2),np.round(param_errors_bsfg[1],2))))
+    # normalized request: selected data files (in the order of selection), scale, fitting model and split/unsplit.
+    key = ('plot', tuple(data[i]['Datafile'] for i in derived_virtual_selected_rows), value,
+        value_fit if value_fit != 'Reset' else None, n_clicks % 2 == 1, catalogue_version())
 
-                    
-                    popt_ctm, pcov_ctm = curve_fit(ctm_fitting, xdata=x,ydata=y,sigma=dy,absolute_sigma=True)
+    return single_flight.do(key, make_plots, set_progress,derived_virtual_selected_rows,value,value_fit,n_clicks,data,value_select)
 
-                    x_fit = np.linspace(E_min, E_max,100)
 
-                    y_fit_ctm = ctm_fitting(x_fit, *popt_ctm)
+def make_plots(set_progress,derived_virtual_selected_rows,value,value_fit,n_clicks,data,value_select):
+    '''Function to make the plots of the selected level density data sets (see plot_selected_data).
+    Inputs: function to report the progress, user selected data sets, choice of linear/log scale, choice of fitting model(s), 
+    checkpoint to see if Split/Unsplit button was clicked, log book rows of the selected data sets.
+    Outputs: Plots of level density data (in split or unsplit version).'''
 
-                    param_errors_ctm = np.sqrt(np.diag(pcov_ctm))
+    # blank_figure() function was defined at the beginning of this document.
+    fig = blank_figure()
 
-                    
+    # a list to store the splitted plots.
+    split_plots = []
+    
+    # If and only if the user selects some data set in the table
+    if derived_virtual_selected_rows and data or value_select:
 
-                    fig.add_trace(go.Scatter(x=x_fit,y=y_fit_ctm,mode='lines',
-                        name='T = {}, E = {}, <br> dT = {}, dE = {}'.format(np.round(popt_ctm[0],2),np.round(popt_ctm[1],2),
-                        np.round(param_errors_ctm[0],2),np.round(param_errors_ctm[1],2))))
 
-                    
+        # by default all plots are unsplit. By default, n_clicks value has been set to 0 (even). 
+        #So, if n_clicks (number of clicks on the split/unsplit button) is an odd integer, that would mean 
+        # the program needs to split the plots.
+        split = (n_clicks % 2 == 1) 
 
-                graphs.append(html.Div([dcc.Graph(figure=fig)], className='graph-item'))
-                
+        # if the user selects to split the graphs, only a grid of placeholders is returned. The figures are made one by one
+        # by render_split_graph (first batch right away, the next ones with the "Show more plots" button), so the first graphs
+        # appear as soon as they are ready, however many data sets are selected.
+        if split:
 
-            return html.Div(graphs,className='graph-grid')
+            set_progress((str(len(derived_virtual_selected_rows)), str(len(derived_virtual_selected_rows))))
 
+            return split_graph_grid(data, value, value_fit)
 
-        #data_df = pd.DataFrame.from_dict(data)
 
-        
         # if the user doesn't opt to split the plots, then
-        for i in derived_virtual_selected_rows:
+        for k,i in enumerate(derived_virtual_selected_rows):
+            set_progress((str(k), str(len(derived_virtual_selected_rows))))
 
             fig.update_layout(autosize=True,
             paper_bgcolor='rgb(30,30,30)', # Background color of the entire plot area
@@ -490,37 +523,21 @@ def plot_selected_data(derived_virtual_selected_rows,value,value_fit,n_clicks,da
             
         )
             
-            Z = data_df['Z'][i]
-            A = data_df['A'][i]
-            datafile = data_df['Datafile'][i]
+            # the log book row of the data set, read from the column arrays of the catalogue (see utils/records.py).
+            record = data[i]
+            Z = record['Z']
+            A = record['A']
+            datafile = record['Datafile']
             
-            E_min = data_df['Emin'][i]
-            E_max = data_df['Emax'][i]
+            E_min = record['Emin']
+            E_max = record['Emax']
 
             
-            #file_loc = '../OhioUniversity/PhD/NLDD/data_sets/' + datafile
+            # level density data (energy, NLD and its uncertainty) from the data store (see utils/data_store.py).
+            E, nld, dnld = load_nld_data(datafile)
 
-            nld_data = pd.read_csv(datafile,header=None,sep=',',comment='#')
-
-            if len(nld_data.columns != 3):
-            	nld_data[2] = 0.0
-
-            nld_data[2] = nld_data[2].replace(np.nan,0.0)
-
-            # apply 20% error if error is listed as 0 or if it is missing
-            nld_data[2] = nld_data.apply(lambda row: 0.2 * row[1] if row.get(2, 0.0) == 0.0 else row.get(2, 0.0), axis=1)
-    
-
-            unnamed_cols = nld_data.filter(like='3').columns
-            if not unnamed_cols.empty:
-                nld_data.drop(columns=unnamed_cols, inplace=True)
-
-            #nld_data.drop(3, axis=1, inplace=True)
-            # renaming columns
-            nld_data.rename(columns={0: "E (MeV)", 1: "NLD", 2: "NLD uncertainity"}, inplace=True)
-
-            fig.add_trace(go.Scatter(x=nld_data['E (MeV)'],y=nld_data['NLD'],error_y=dict(type='data',array=nld_data['NLD uncertainity']),mode='markers',
-                    name=f"{data_df['Author'][i]} - {data_df['Isotope'][i]}"))
+            fig.add_trace(go.Scatter(x=E,y=nld,error_y=dict(type='data',array=dnld),mode='markers',
+                    name=f"{record['Author']} - {record['Isotope']}"))
 
             fig.update_xaxes(showline=True,linecolor='orange',color='orange',title_font_color='orange', linewidth=2,mirror=True,
                     showgrid=True,gridcolor='LightGray',showticklabels=True,title_text='E (MeV)')
@@ -538,128 +555,255 @@ def plot_selected_data(derived_virtual_selected_rows,value,value_fit,n_clicks,da
 
                 
             # Fitting data in unsplit mode.
+            add_fit_traces(fig, value_fit, datafile, E_min, E_max, A)
 
-            if value_fit == 'CTM':
+            split_plots.append(dcc.Graph(id=f'graph-{i}',figure=fig))
+          
+    return [dcc.Graph(id='graph',figure=fig,style={"width":"100%","height":"60vh"})]
 
-                nld_data_fit = nld_data[(nld_data['E (MeV)'] > E_min) & (nld_data['E (MeV)'] < E_max+0.1)]
 
-                x,y,dy = nld_data_fit['E (MeV)'],nld_data_fit['NLD'],nld_data_fit['NLD uncertainity']
 
-                dy = np.where(dy == 0, 0.2*y, dy)
-               
-                popt, pcov = curve_fit(ctm_fitting, xdata=x,ydata=y,sigma=dy,absolute_sigma=True)
 
-                x_fit = np.linspace(E_min, E_max,100)
+# ---------------------------------------------------- 3.2) Comparison mode ------------------------------------
 
-                y_fit = ctm_fitting(x_fit, *popt)
+def make_comparison_plots(set_progress, data, value):
+    '''Function to compare the selected data sets of every nucleus on a common energy grid (see utils/comparison.py).
+    All selected data sets are put on the grid in one go; every nucleus gets a figure with its data sets and their weighted
+    average (top) and the ratio of every data set to the average (bottom).
+    Inputs: function to report the progress, log book rows of the selected data sets, choice of linear/log scale.
+    Output: one graph per nucleus.'''
 
-                param_errors = np.sqrt(np.diag(pcov))
+    # the grids of all data sets at once (only the ones that are not cached yet are interpolated).
+    interpolated_datasets([record['Datafile'] for record in data])
 
-                
+    nuclei = {}
+    for record in data:
+        nuclei.setdefault((record['Z'], record['A']), []).append(record)
 
-                fig.add_trace(go.Scatter(x=x_fit,y=y_fit,mode='lines',
-                    name='T = {}, E = {}, <br> dT = {}, dE = {}'.format(np.round(popt[0],2),np.round(popt[1],2),np.round(param_errors[0],2),
-                        np.round(param_errors[1],2))))
+    graphs = []
+    for k, records in enumerate(nuclei.values()):
+        set_progress((str(k), str(len(nuclei))))
 
-                
-            elif value_fit == 'BSFG':
+        comparison = compare_datasets([record['Datafile'] for record in records])
+        E = comparison['E']
 
-                nld_data_fit = nld_data[(nld_data['E (MeV)'] > E_min) & (nld_data['E (MeV)'] < E_max+0.1)]
+        fig = make_subplots(rows=2, cols=1, shared_xaxes=True, row_heights=[0.7, 0.3], vertical_spacing=0.05)
 
-                x,y,dy = nld_data_fit['E (MeV)'],nld_data_fit['NLD'],nld_data_fit['NLD uncertainity']
-                
-                dy = np.where(dy == 0, 0.2*y, dy)
-                
-                # BSFG fit with bounds and initial guess to avoid non-physical solutions
-                minE = np.min(x)
-                p0 = [max(1e-6, A/8.0), minE/2.0]
-                bounds = ([1e-6, -50.0], [1e3, minE - 1e-6])
-                popt, pcov = curve_fit(lambda E, a, Delta: bsfg_fitting(E,a,Delta,A), xdata=x, ydata=y,
-                                        sigma=dy, absolute_sigma=True, p0=p0, bounds=bounds, maxfev=10000)
+        for j, record in enumerate(records):
+            name = f"{record['Author']} - {record['Isotope']}"
 
-                x_fit = np.linspace(E_min, E_max,100)
+            # only the energies where the data set (or its ratio) is defined are sent.
+            on = np.isfinite(comparison['nld'][j])
+            fig.add_trace(go.Scatter(x=E[on],y=comparison['nld'][j][on],error_y=dict(type='data',array=comparison['dnld'][j][on]),
+                mode='lines',name=name,legendgroup=name), row=1, col=1)
 
-                y_fit = bsfg_fitting(x_fit, *popt,A)
+            on = np.isfinite(comparison['ratio'][j])
+            fig.add_trace(go.Scatter(x=E[on],y=comparison['ratio'][j][on],error_y=dict(type='data',array=comparison['dratio'][j][on]),
+                mode='markers',marker=dict(size=4),name=name,legendgroup=name,showlegend=False), row=2, col=1)
 
-                param_errors = np.sqrt(np.diag(pcov))
+        # weighted average with its 1 sigma band.
+        fig.add_trace(go.Scatter(x=E,y=comparison['mean']-comparison['dmean'],mode='lines',line=dict(width=0),
+            showlegend=False,hoverinfo='skip'), row=1, col=1)
+        fig.add_trace(go.Scatter(x=E,y=comparison['mean']+comparison['dmean'],mode='lines',line=dict(width=0),fill='tonexty',
+            showlegend=False,hoverinfo='skip'), row=1, col=1)
+        fig.add_trace(go.Scatter(x=E,y=comparison['mean'],mode='lines',line=dict(color='white',dash='dash'),
+            name='Weighted average'), row=1, col=1)
 
-                
+        fig.update_layout(autosize=True,paper_bgcolor='rgb(30,30,30)',plot_bgcolor='rgb(30,30,30)',height=700,
+            showlegend=True,legend_font_color='white',
+            title=dict(text=f"{records[0]['Isotope']}: {len(records)} data set(s)",font=dict(color='orange')))
+        fig.update_xaxes(showline=True,linecolor='orange',color='orange',linewidth=2,mirror=True,showgrid=True,gridcolor='LightGray')
+        fig.update_xaxes(title_text='E (MeV)', row=2, col=1)
+        fig.update_yaxes(showline=True,linecolor='orange',color='orange',linewidth=2,mirror=True,showgrid=True,gridcolor='LightGray')
+        fig.update_yaxes(title_text='NLD (1/MeV)',tickformat=".2e",type='log' if value == 'log' else 'linear', row=1, col=1)
+        fig.update_yaxes(title_text='Ratio to average', row=2, col=1)
 
-                fig.add_trace(go.Scatter(x=x_fit,y=y_fit,mode='lines',
-                    name='a = {}, del = {}, <br> da = {}, ddel = {}'.format(np.round(popt[0],2),np.round(popt[1],2),np.round(param_errors[0],2),
-                        np.round(param_errors[1],2))))
+        graphs.append(dcc.Graph(figure=fig,style={"width":"100%"}))
 
-                
-            elif value_fit == 'All':
+    return [html.Div(graphs,className='graph-grid-container')]
 
-                nld_data_fit = nld_data[(nld_data['E (MeV)'] > E_min) & (nld_data['E (MeV)'] < E_max+0.1)]
 
-                x,y,dy = nld_data_fit['E (MeV)'],nld_data_fit['NLD'],nld_data_fit['NLD uncertainity']
+# ---------------------------------------------------- 3.1) Split mode ------------------------------------
 
-                dy = np.where(dy == 0, 0.2*y, dy)
-                
-                # BSFG fit with bounds and initial guess to avoid non-physical solutions
-                minE = np.min(x)
-                p0 = [max(1e-6, A/8.0), minE/2.0]
-                bounds = ([1e-6, -50.0], [1e3, minE - 1e-6])
-                popt_bsfg, pcov_bsfg = curve_fit(lambda E, a, Delta: bsfg_fitting(E,a,Delta,A), xdata=x, ydata=y,
-                                                 sigma=dy, absolute_sigma=True, p0=p0, bounds=bounds, maxfev=10000)
+# Number of graphs rendered at a time in split mode.
+SPLIT_BATCH_SIZE = 6
 
-                x_fit = np.linspace(E_min, E_max,100)
+def split_graph_item(k, record, value, value_fit):
+    '''Function to make the placeholder of one graph of the split grid. The Store holds the request of the graph;
+    when the placeholder appears on the page, render_split_graph makes the figure.'''
 
-                y_fit_bsfg = bsfg_fitting(x_fit, *popt_bsfg,A)
+    return html.Div([
+        dcc.Store(id={'type':'split-graph-request','index':k},data={'id':record['Name'],'scale':value,'fit':value_fit}),
+        dcc.Loading(html.Div(html.P(f"{record['Author']} - {record['Isotope']}",className='graph-placeholder-label'),
+            id={'type':'split-graph','index':k},className='graph-placeholder'))
+        ], className='graph-item')
 
-                param_errors_bsfg = np.sqrt(np.diag(pcov_bsfg))
 
-                
-                fig.add_trace(go.Scatter(x=x_fit,y=y_fit_bsfg,mode='lines',
-                    name='a = {}, del = {}, <br> da = {}, ddel = {}'.format(np.round(popt_bsfg[0],2),np.round(popt_bsfg[1],2),
-                        np.round(param_errors_bsfg[0],2),np.round(param_errors_bsfg[1],2))))
+def split_graph_grid(data, value, value_fit):
+    '''Function to make the grid of the split mode: placeholders for the first batch of data sets and a button for the next ones.
+    Inputs: log book rows of the selected data sets, choice of linear/log scale, choice of fitting model(s).
+    Output: the grid (without any figure).'''
 
+    items = [split_graph_item(k, record, value, value_fit) for k, record in enumerate(data[:SPLIT_BATCH_SIZE])]
 
-                popt_ctm, pcov_ctm = curve_fit(ctm_fitting, xdata=x,ydata=y,sigma=dy,absolute_sigma=True)
+    return html.Div([
+        html.Div(items,id='split_graph_grid',className='graph-grid'),
+        html.Button(show_more_label(len(data) - len(items)),id='show_more_graphs_btn',className='show-more-btn',
+            style={'display':'inline' if len(data) > len(items) else 'none'}),
+        dcc.Store(id='split-graphs-store',data={'ids':[record['Name'] for record in data],'scale':value,'fit':value_fit,
+            'shown':len(items)})
+        ], className='graph-grid-container')
 
-                x_fit = np.linspace(E_min, E_max,100)
 
-                y_fit_ctm = ctm_fitting(x_fit, *popt_ctm)
+def show_more_label(n_left):
+    return f'Show more plots ({n_left} left)'
 
-                param_errors_ctm = np.sqrt(np.diag(pcov_ctm))
 
-                
-                fig.add_trace(go.Scatter(x=x_fit,y=y_fit_ctm,mode='lines',
-                    name='T = {}, E = {},<br> dT = {}, dE = {}'.format(np.round(popt_ctm[0],2),np.round(popt_ctm[1],2),
-                        np.round(param_errors_ctm[0],2),np.round(param_errors_ctm[1],2))))
+@callback(
+    [Output('split_graph_grid','children'),Output('split-graphs-store','data'),Output('show_more_graphs_btn','children'),
+     Output('show_more_graphs_btn','style')],
+    Input('show_more_graphs_btn','n_clicks'),
+    State('split-graphs-store','data'),prevent_initial_call=True)
 
-                
-            split_plots.append(dcc.Graph(id=f'graph-{i}',figure=fig))
-          
-    return [dcc.Graph(id='graph',figure=fig,style={"width":"100%","height":"60vh"})]
+def show_more_graphs(n_clicks, request):
+    '''Function to add the placeholders of the next batch of data sets to the split grid (the graphs that are already shown are kept).
+    Inputs: number of clicks on the "Show more plots" button, the split grid request (IDs, scale, fit and number of graphs shown).
+    Outputs: the new placeholders (appended to the grid), the updated request, the label and style of the button.'''
+
+    shown = request['shown']
+    batch = selected_records(request['ids'][shown:shown + SPLIT_BATCH_SIZE])
+
+    grid = dash.Patch()
+    for k, record in enumerate(batch, start=shown):
+        grid.append(split_graph_item(k, record, request['scale'], request['fit']))
+
+    request['shown'] = shown + len(batch)
+    n_left = len(request['ids']) - request['shown']
+
+    return [grid, request, show_more_label(n_left), {'display':'inline' if n_left > 0 else 'none'}]
+
+
+# The fits of a graph can take long (Bayesian fits above all), so every graph is a background job like the other plots:
+# the gunicorn threads only start it and answer the polls, and a graph that was made before is served from the job cache.
+@callback(
+    Output({'type':'split-graph','index':dash.MATCH},'children'),
+    Input({'type':'split-graph-request','index':dash.MATCH},'data'),
+    background=True, interval=500)
+
+def render_split_graph(request):
+    '''Function to make one graph of the split grid. Every graph is a separate background job, so the graphs appear one by one.
+    Input: the request of the graph (ID of the data set, scale and fitting model).
+    Output: the graph.'''
+
+    records = selected_records([request['id']])
+    if not records:
+        return html.P('This data set is no longer available.',className='graph-placeholder-label')
+
+    # the data and the fits come from the caches (see utils/data_store.py and utils/fits.py); identical figures that are
+    # requested at the same time are made only once.
+    fit = request['fit'] if request['fit'] != 'Reset' else None
+    key = ('split-graph', records[0]['Datafile'], request['scale'], fit, catalogue_version())
+
+    return dcc.Graph(figure=single_flight.do(key, make_split_figure, records[0], request['scale'], request['fit']))
+
+
+def make_split_figure(record, value, value_fit):
+    '''Function to make the figure of one data set in split mode.
+    Inputs: log book row of the data set, choice of linear/log scale, choice of fitting model(s).
+    Output: the figure.'''
+
+    fig = blank_figure()
+    A = record['A']
+    datafile = record['Datafile']
+
+    # minimum and maximum energy of fitting.
+    E_min = record['Emin']
+    E_max = record['Emax']
+
+    # level density data (energy, NLD and its uncertainty) from the data store (see utils/data_store.py).
+    E, nld, dnld = load_nld_data(datafile)
 
+    fig.add_trace(go.Scatter(x=E,y=nld,error_y=dict(type='data',array=dnld),mode='markers',
+        name=f"{record['Author']} - {record['Isotope']}",showlegend=True))
 
+    fig.update_xaxes(showline=True,linecolor='orange',color='orange',title_font_color='orange', linewidth=2,mirror=True,
+        showgrid=True,gridcolor='LightGray',showticklabels=True, title_text='E (MeV)')
 
+    if value == 'log':
+
+        fig.update_yaxes(showline=True,type="log", linecolor='orange',color='orange',title_font_color='orange', linewidth=2,mirror=True,
+        tickformat=".2e",dtick=0.5,showgrid=True,gridcolor='LightGray',showticklabels=True,title_text='NLD (1/MeV)')
+
+    else:
+
+        fig.update_yaxes(showline=True,linecolor='orange',color='orange',title_font_color='orange', linewidth=2,mirror=True,
+        showgrid=True,gridcolor='LightGray',showticklabels=True,tickformat=".2e",title_text='NLD (1/MeV)')
+
+    fig.update_layout(legend_font_color='white') # setting legend font color
+
+    # fit the data according to the model(s) the user selects.
+    add_fit_traces(fig, value_fit, datafile, E_min, E_max, A)
+
+    return fig
+
+
+
+# Rendering the figures to png files is slow, so the zip file is also built in a background job with progress reporting and cancellation.
+# The number of clicks is not part of the cache key, so downloading the same selection again is served from the cache.
 
 @callback(
     Output("download-data", "data"),
     [Input("download_btn", "n_clicks")],
-    [State('data_log_table', 'derived_virtual_selected_rows'), State('full-data-store', 'data'),
-     State('div-graphs', 'children'),State('split_unsplit_btn','n_clicks')]
+    [State('selected-ids', 'data'), State('div-graphs', 'children'),State('split_unsplit_btn','n_clicks'),
+     State('radio_btn','value'),State('radio_btn_fitting','value'),State('compare_btn','value')],
+    background=True, interval=500,
+    progress=[Output('download_progress','value'),Output('download_progress','max')],
+    running=[(Output('download_progress_container','style'),{'display':'flex'},{'display':'none'}),
+             (Output('download_btn','disabled'),True,False)],
+    cancel=[Input('cancel_download_btn','n_clicks')],
+    cache_args_to_ignore=[0]
 )
-def create_zip(n_clicks_download,selected_rows, data, div_graphs_children,n_clicks_split):
-
-    if n_clicks_download is None or not selected_rows:
+def create_zip(set_progress,n_clicks_download,selected_ids, div_graphs_children,n_clicks_split,value,value_fit,value_compare):
+    '''Function to download the selected data sets and their figure(s) as a zip file.
+    Identical downloads that run at the same time are built only once (see utils/singleflight.py).
+    Inputs: function to report the progress, number of clicks on the download button, IDs of the selected data sets,
+    the displayed graphs, number of clicks on the Split/Unsplit button, choice of linear/log scale, choice of fitting model(s),
+    whether the data sets are compared.
+    Output: the zip file (base64 encoded).'''
+
+    if n_clicks_download is None or not selected_ids:
         return dash.no_update
 
+    data = selected_records(selected_ids)
+    selected_rows = list(range(len(data)))
+
     unsplit = (n_clicks_split % 2 == 0)
+    # the comparison plots replace the split or unsplit plots whatever the state of the Split/Unsplit button.
+    compare = bool(value_compare)
+
+    # normalized request: selected data files and a fingerprint of the displayed figure(s) (unsplit or comparison), or the
+    # scale and the fitting model the figures are made with (split, the split grid only has the graphs that have been shown so far).
+    if unsplit or compare:
+        figures_hash = hashlib.sha256(json.dumps(div_graphs_children, sort_keys=True).encode('utf-8')).hexdigest()
+    else:
+        figures_hash = (value, value_fit if value_fit != 'Reset' else None)
+    key = ('zip', tuple(data[i]['Datafile'] for i in selected_rows), unsplit, compare, figures_hash, catalogue_version())
+
+    return single_flight.do(key, make_zip, set_progress, selected_rows, data, div_graphs_children, unsplit, value, value_fit, compare)
 
 
+def make_zip(set_progress, selected_rows, data, div_graphs_children, unsplit, value=None, value_fit=None, compare=False):
+    '''Function to build the zip file of the selected data sets and their figure(s) (see create_zip).
+    The figures are the ones on the screen: the unsplit figure or the comparison plots (taken from the displayed graphs),
+    or the figures of the split grid (made again).'''
+
     buffer = io.BytesIO()
     with zipfile.ZipFile(buffer, "w") as zf:
-        data_df = pd.DataFrame.from_dict(data)
-        selected_df = data_df.iloc[selected_rows]
-        selected_data_sets = selected_df['Datafile']
-        
+
         for ind,i in enumerate(selected_rows):
-            csv_data_set = pd.read_csv(selected_data_sets[i],comment='#',header=None)
+            set_progress((str(ind), str(len(selected_rows))))
+
+            csv_data_set = pd.read_csv(resolve_path(data[i]['Datafile']),comment='#',header=None)
             csv_data_set.rename(columns={0: "E (MeV)", 1: "NLD", 2: "NLD uncertainity"}, inplace=True)
 
             unnamed_cols = csv_data_set.filter(like='3').columns
@@ -669,10 +813,10 @@ def create_zip(n_clicks_download,selected_rows, data, div_graphs_children,n_clic
             csv_data_bytes = csv_data_set.to_csv(index=False)
             zf.writestr("selected_data_{}.csv".format(ind), csv_data_bytes)
 
-            if not unsplit:
+            if not (unsplit or compare):
 
-                figure = div_graphs_children['props']['children'][ind]['props']['children'][0]['props']['figure']
-                fig = go.Figure(figure)
+                # the figures of the split grid are made on demand (see render_split_graph), so they are made here again.
+                fig = make_split_figure(data[i], value, value_fit)
                 # Write the image to the buffer
                 image_data = io.BytesIO()
                 fig.write_image(image_data, format='png')
@@ -680,7 +824,7 @@ def create_zip(n_clicks_download,selected_rows, data, div_graphs_children,n_clic
                 zf.writestr(f"figure_{ind}.png", image_data.read())
 
         
-        if unsplit: 
+        if unsplit or compare:
             for child in div_graphs_children:
                 if 'props' in child and 'figure' in child['props']:
                     figure = child['props']['figure']
@@ -692,6 +836,16 @@ def create_zip(n_clicks_download,selected_rows, data, div_graphs_children,n_clic
                     image_data.seek(0)
                     zf.writestr("figure.png", image_data.read())
                     break
+
+                # comparison mode: one graph per nucleus (see make_comparison_plots).
+                graphs = child.get('props', {}).get('children') if isinstance(child, dict) else None
+                if isinstance(graphs, list):
+                    for k, graph in enumerate(graphs):
+                        if isinstance(graph, dict) and 'figure' in graph.get('props', {}):
+                            image_data = io.BytesIO()
+                            go.Figure(graph['props']['figure']).write_image(image_data, format='png')
+                            image_data.seek(0)
+                            zf.writestr(f"comparison_{k}.png", image_data.read())
         
                 
                 
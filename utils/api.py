@@ -0,0 +1,214 @@
+'''
+Read-only REST API of the archive (version 1), served by the Flask server of the website under /api/v1.
+
+  GET /api/v1/datasets                      catalogue, filtered by ?Z=&A=&method=&status=&reaction=
+                                            (method and status may be given several times or comma separated)
+  GET /api/v1/datasets/<name>               metadata and arrays of one data set (name = data file without extension, e.g. NLD_26_57_1)
+  GET /api/v1/datasets/<name>/fits/<model>  cached fit of one data set (CTM, BSFG, GC, CTM_MCMC or BSFG_MCMC)
+  GET /api/v1/bulk?names=a,b,...&fits=CTM   many data sets (and fits) in one round trip (also POST with a JSON body)
+
+Bulk requests only return the Bayesian fits (CTM_MCMC, BSFG_MCMC) that are already cached: sampling takes about half a
+second per data set, which would hold a server thread for minutes. The others are reported with "computed": false and
+are computed by requesting the fit of the data set itself. Fits are only returned as JSON.
+
+The arrays can be requested as JSON (default), as numpy binary (?format=npy for one data set, ?format=npz for bulk
+requests) or as Apache Arrow IPC streams (?format=arrow, needs pyarrow). Binary arrays have the columns E (MeV), NLD (1/MeV), dNLD (1/MeV).
+Everything is served from the in-memory catalogue (utils/catalogue.py) and data store (utils/data_store.py).
+'''
+
+import io
+import numpy as np
+from flask import Blueprint, jsonify, request, abort, send_file
+from utils.catalogue import get_catalogue, filter_catalogue
+from utils.data_store import load_nld_data
+from utils.fits import cached_fit, FIT_MODELS
+from utils.mcmc import posterior_summary
+from utils.http_cache import dataset_url
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+
+api = Blueprint('api_v1', __name__, url_prefix='/api/v1')
+
+MCMC_MODELS = ('CTM_MCMC', 'BSFG_MCMC')
+
+# Largest number of data sets in one bulk request.
+MAX_BULK = 1000
+
+
+def records(df):
+    '''Function to convert catalogue rows to JSON-friendly dictionaries (missing values become null).'''
+
+    out = df.astype(object).where(df.notna(), None).to_dict('records')
+    for record in out:
+        record['url'] = dataset_url(record['Datafile'])
+
+    return out
+
+
+def get_multi_arg(name):
+    '''Function to read a query parameter that may be repeated or comma separated (e.g. ?method=Oslo,Evaporation).'''
+
+    values = []
+    for value in request.args.getlist(name):
+        values += [v.strip() for v in value.split(',') if v.strip()]
+
+    return values or None
+
+
+def find_dataset(name):
+    '''Function to get the catalogue row of a data set by name (404 if there is no such data set).'''
+
+    df = get_catalogue()
+    rows = df[df['Name'] == name]
+    if rows.empty:
+        abort(404, description=f'Unknown data set: {name}')
+
+    return rows.iloc[0]
+
+
+def dataset_arrays(row):
+    '''Function to get the arrays of a data set as one (n, 3) array with the columns E, NLD, dNLD.'''
+
+    return np.column_stack(load_nld_data(row['Datafile']))
+
+
+def dataset_fit(row, model, compute=True):
+    '''Function to get the cached fit of a data set; errors of failing fits are returned instead of raised.
+    With compute=False, Bayesian fits that are not cached yet are reported as not computed instead of being sampled.'''
+
+    try:
+        if model in MCMC_MODELS:
+            summary = posterior_summary(row['Datafile'], model.split('_')[0], row['Emin'], row['Emax'], row['A'], compute=compute)
+            if summary is None:
+                return {'model': model, 'computed': False,
+                        'error': f"Not computed yet, request /api/v1/datasets/{row['Name']}/fits/{model} to compute it."}
+            return summary
+
+        return cached_fit(row['Datafile'], model, row['Emin'], row['Emax'], row['A'])
+
+    except Exception as error:
+        return {'model': model, 'error': str(error)}
+
+
+def arrow_response(tables):
+    '''Function to send {name: (n, 3) array} as an Arrow IPC stream, one record batch per data set with the name in the schema metadata.'''
+
+    if pyarrow is None:
+        abort(406, description='Arrow output needs pyarrow, which is not installed on this server.')
+
+    sink = io.BytesIO()
+    schema = pyarrow.schema([('E', pyarrow.float64()), ('NLD', pyarrow.float64()), ('dNLD', pyarrow.float64())])
+    with pyarrow.ipc.new_stream(sink, schema) as writer:
+        for name, array in tables.items():
+            batch = pyarrow.record_batch([pyarrow.array(array[:, k]) for k in range(3)], schema=schema.with_metadata({'name': name}))
+            writer.write_batch(batch)
+
+    sink.seek(0)
+    return send_file(sink, mimetype='application/vnd.apache.arrow.stream', download_name='datasets.arrow')
+
+
+def check_model(model):
+    if model not in FIT_MODELS + MCMC_MODELS:
+        abort(400, description=f'Unknown model: {model}. Use one of {", ".join(FIT_MODELS + MCMC_MODELS)}.')
+
+
+@api.route('/datasets')
+def list_datasets():
+    '''Catalogue query by Z, A, method, status and reaction.'''
+
+    Z = request.args.get('Z', type=int)
+    A = request.args.get('A', type=int)
+
+    df = filter_catalogue(get_catalogue(), Z=Z, A=A, methods=get_multi_arg('method'), reaction=request.args.get('reaction'),
+                          statuses=get_multi_arg('status'))
+
+    return jsonify(count=len(df), datasets=records(df))
+
+
+@api.route('/datasets/<name>')
+def get_dataset(name):
+    '''Metadata and arrays of one data set.'''
+
+    row = find_dataset(name)
+    array = dataset_arrays(row)
+    output_format = request.args.get('format', 'json')
+
+    if output_format == 'npy':
+        buffer = io.BytesIO()
+        np.save(buffer, array)
+        buffer.seek(0)
+        return send_file(buffer, mimetype='application/octet-stream', download_name=f'{name}.npy')
+
+    if output_format == 'arrow':
+        return arrow_response({name: array})
+
+    return jsonify(dataset=records(row.to_frame().T)[0], E=array[:, 0].tolist(), NLD=array[:, 1].tolist(), dNLD=array[:, 2].tolist())
+
+
+@api.route('/datasets/<name>/fits/<model>')
+def get_fit(name, model):
+    '''Cached fit of one data set.'''
+
+    check_model(model)
+
+    return jsonify(dataset=name, fit=dataset_fit(find_dataset(name), model))
+
+
+@api.route('/bulk', methods=['GET', 'POST'])
+def bulk():
+    '''Many data sets (selected by name, or by the same filters as /datasets) with their arrays and fits in one response.
+    JSON body for POST: {"names": [...], "fits": [...], "format": "json" | "npz" | "arrow"}.'''
+
+    body = (request.get_json(silent=True) or {}) if request.method == 'POST' else {}
+
+    names = body.get('names') or get_multi_arg('names')
+    models = body.get('fits') or get_multi_arg('fits') or []
+    output_format = body.get('format') or request.args.get('format', 'json')
+
+    for model in models:
+        check_model(model)
+
+    if models and output_format != 'json':
+        abort(400, description='Fits are only returned as JSON: use format=json, or request the arrays and the fits separately.')
+
+    df = get_catalogue()
+    if names:
+        df = df[df['Name'].isin(names)]
+    else:
+        df = filter_catalogue(df, Z=request.args.get('Z', type=int), A=request.args.get('A', type=int), methods=get_multi_arg('method'),
+                              reaction=request.args.get('reaction'), statuses=get_multi_arg('status'))
+
+    if len(df) > MAX_BULK:
+        abort(400, description=f'Too many data sets ({len(df)}), at most {MAX_BULK} per request.')
+
+    tables = {row['Name']: dataset_arrays(row) for _, row in df.iterrows()}
+
+    if output_format == 'npz':
+        buffer = io.BytesIO()
+        np.savez(buffer, **tables)
+        buffer.seek(0)
+        return send_file(buffer, mimetype='application/octet-stream', download_name='datasets.npz')
+
+    if output_format == 'arrow':
+        return arrow_response(tables)
+
+    datasets = []
+    for record, (_, row) in zip(records(df), df.iterrows()):
+        array = tables[row['Name']]
+        record.update(E=array[:, 0].tolist(), NLD=array[:, 1].tolist(), dNLD=array[:, 2].tolist())
+        if models:
+            record['fits'] = {model: dataset_fit(row, model, compute=False) for model in models}
+        datasets.append(record)
+
+    return jsonify(count=len(datasets), datasets=datasets)
+
+
+@api.errorhandler(400)
+@api.errorhandler(404)
+@api.errorhandler(406)
+def json_error(error):
+    return jsonify(error=error.description), error.code
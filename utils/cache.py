@@ -0,0 +1,122 @@
+'''
+Shared on-disk cache of the website.
+
+The cache lives in a local directory shared by all gunicorn workers (diskcache is safe to use from several
+processes at once). It backs the Dash background callbacks (long fits and zip downloads run in job processes,
+see pages/search_Z_A.py) and stores expensive results such as the Bayesian posterior summaries.
+
+Many processes write at the same time (8 gunicorn workers with 4 threads each, plus the background job processes), and a
+single SQLite database makes them wait for each other's write lock. Both caches are therefore split into shards
+(diskcache.FanoutCache, one database per shard), the background jobs and their progress get a cache of their own, and
+writes that still find their shard locked are retried instead of failing (a lost job result would leave the browser
+polling forever).
+'''
+
+import os
+import sys
+import tempfile
+import functools
+import psutil
+import diskcache
+import multiprocess
+from dash import DiskcacheManager
+from dash.background_callback.managers.diskcache_manager import _make_job_fn
+from utils.singleflight import SingleFlight
+from utils.catalogue import catalogue_version
+
+
+CACHE_DIR = os.environ.get('NLD_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'nld-cache'))
+
+# Results of background jobs are kept for a day, the level density data rarely changes more often than that.
+CACHE_EXPIRE = 24 * 60 * 60
+
+# Number of SQLite databases per cache, and seconds a single attempt waits for the lock of a shard before it is retried.
+CACHE_SHARDS = 8
+CACHE_TIMEOUT = 1.0
+
+
+class RetryingCache(diskcache.FanoutCache):
+    '''Sharded cache whose reads and writes are retried while their shard is locked, instead of giving up
+    (diskcache.FanoutCache returns the default or False after a timeout unless retry=True is passed, and Dash never passes it).'''
+
+    def get(self, key, default=None, read=False, expire_time=False, tag=False, retry=True):
+        return super().get(key, default=default, read=read, expire_time=expire_time, tag=tag, retry=retry)
+
+    def set(self, key, value, expire=None, read=False, tag=None, retry=True):
+        return super().set(key, value, expire=expire, read=read, tag=tag, retry=retry)
+
+    def add(self, key, value, expire=None, read=False, tag=None, retry=True):
+        return super().add(key, value, expire=expire, read=read, tag=tag, retry=retry)
+
+    def delete(self, key, retry=True):
+        return super().delete(key, retry=retry)
+
+    def touch(self, key, expire=None, retry=True):
+        return super().touch(key, expire=expire, retry=retry)
+
+    def evict(self, tag, retry=True):
+        return super().evict(tag, retry=retry)
+
+
+# Cached fits are tagged with their data file, so they can be evicted when the file changes (see utils/watcher.py).
+cache = RetryingCache(os.path.join(CACHE_DIR, 'shared'), shards=CACHE_SHARDS, timeout=CACHE_TIMEOUT, tag_index=True)
+
+# Results and progress of the background jobs, polled by the browsers every 0.5 s.
+job_cache = RetryingCache(os.path.join(CACHE_DIR, 'jobs'), shards=CACHE_SHARDS, timeout=CACHE_TIMEOUT)
+
+
+def data_version():
+    '''Function to get a token that changes whenever the data of the archive changes.
+    It is part of the cache key of every background job, so editing the log book or a data file
+    invalidates the plots and downloads computed from the old version.'''
+
+    return catalogue_version()
+
+
+# The background jobs are not forked from the gunicorn workers themselves: they run several threads, and a lock that
+# another thread holds at that moment (a module being imported, SQLite opening a database) stays locked forever in the
+# job, which then hangs. They are forked from a single-threaded server process that has imported the website once, so
+# importing app.py must not start any thread (the catalogue watcher is started by the gunicorn workers, see gunicorn.conf.py).
+# JobManager relies on the job functions of Dash's DiskcacheManager (_make_job_fn, call_job_fn), which are not public API:
+# check them when updating Dash (see requirements.txt).
+JOB_PROCESSES = multiprocess.get_context('forkserver')
+JOB_PROCESSES.set_forkserver_preload(['app'])
+
+
+def run_job(module, name, handle, progress, *args):
+    '''Function to run a background job in its process. The callback is looked up by name in the modules the server
+    process has imported (the pages are not importable by name, so the callback could not be sent to the job itself).'''
+
+    fn = getattr(sys.modules[module], name)
+
+    return _make_job_fn(fn, handle, progress)(*args)
+
+
+class JobManager(DiskcacheManager):
+    '''DiskcacheManager that starts the jobs from JOB_PROCESSES, and that tolerates jobs which exit while they are
+    being terminated (Dash terminates the job process when its result is read, and a job that has just finished on its
+    own made psutil raise NoSuchProcess in the middle of it, which turned the finished job into a callback error).'''
+
+    def make_job_fn(self, fn, progress, key=None):
+        return functools.partial(run_job, fn.__module__, fn.__qualname__, self.handle, progress)
+
+    def call_job_fn(self, key, job_fn, args, context):
+        process = JOB_PROCESSES.Process(target=job_fn, args=(key, self._make_progress_key(key), args, context))
+        process.start()
+        return process.pid
+
+    def terminate_job(self, job):
+        try:
+            super().terminate_job(job)
+        except psutil.NoSuchProcess:
+            pass
+
+
+background_callback_manager = JobManager(job_cache, cache_by=[data_version], expire=CACHE_EXPIRE)
+
+
+# Identical requests that arrive at the same time (same data sets, model, scale, ...) are computed only once,
+# also across gunicorn workers and background jobs (see utils/singleflight.py).
+COALESCE_EXPIRE = 60
+
+single_flight = SingleFlight(lock_dir=os.path.join(CACHE_DIR, 'locks'), result_cache=cache, expire=COALESCE_EXPIRE)
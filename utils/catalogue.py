@@ -0,0 +1,305 @@
+'''
+The catalogue of the archive: the main log file (log_book_new.xlsx) with one row per data set.
+
+The log file is read once per process and shared (read-only) by the pages and the REST API.
+The data can also live outside of the image, in the directory given by the NLD_DATA_DIR environment variable
+(the /srv/nld-db volume of docker-compose.yml). Files found there take precedence over the copies in the image,
+and utils/watcher.py reloads them when they change, swapping in a new catalogue with swap_catalogue().
+'''
+
+import os
+import hashlib
+import functools
+import threading
+import numpy as np
+import pandas as pd
+from collections import OrderedDict
+from utils.reaction_index import ReactionIndex, normalize_reaction
+from utils.records import CatalogueArrays
+
+
+LOG_BOOK = 'log_book_new.xlsx'
+
+# Directories with the level density data files (the Datafile column of the log book starts with one of them).
+DATA_DIRS = ('Accepted', 'Probation', 'Rejected')
+
+DATA_DIR = os.environ.get('NLD_DATA_DIR')
+
+_catalogue = None
+_version = None
+_lock = threading.Lock()
+
+# Reaction search indexes and column arrays of the last few catalogues (see reaction_index and catalogue_arrays).
+CATALOGUE_CACHE_SIZE = 4
+_reaction_indexes = OrderedDict()
+_catalogue_arrays = OrderedDict()
+
+
+def resolve_path(relative_path):
+    '''Function to find a file of the archive: in NLD_DATA_DIR if it is there, otherwise in the working directory (the image).'''
+
+    if DATA_DIR:
+        path = os.path.join(DATA_DIR, relative_path)
+        if os.path.exists(path):
+            return path
+
+    return relative_path
+
+
+def scan_files():
+    '''Function to list the files of the archive (log book and data files) with their modification time and size.
+    Output: dictionary {relative path: (mtime in ns, size)}.'''
+
+    files = {}
+
+    for root in ['.', DATA_DIR] if DATA_DIR else ['.']:
+        for relative_path in [LOG_BOOK] + [os.path.join(d, f) for d in DATA_DIRS if os.path.isdir(os.path.join(root, d))
+                                           for f in os.listdir(os.path.join(root, d)) if f.endswith('.csv')]:
+            path = os.path.join(root, relative_path)
+            if os.path.isfile(path):
+                # files in NLD_DATA_DIR (scanned last) replace the ones in the image.
+                stat = os.stat(path)
+                files[relative_path] = (stat.st_mtime_ns, stat.st_size)
+
+    return files
+
+
+def files_version(files):
+    '''Function to turn the output of scan_files into a short token that changes whenever any file changes.'''
+
+    return hashlib.sha256(repr(sorted(files.items())).encode('utf-8')).hexdigest()[:16]
+
+
+def read_catalogue(path=None):
+    '''Function to read the main log file.
+    Rows without a data file are dropped, and every data set gets a name: its data file without directory and extension (e.g. NLD_26_57_1).
+    Output: pandas DataFrame with one row per data set.'''
+
+    df = pd.read_excel(path or resolve_path(LOG_BOOK))
+    df = df.dropna(subset=['Datafile'])
+    df['Name'] = df['Datafile'].map(lambda datafile: os.path.splitext(os.path.basename(datafile))[0])
+
+    return df
+
+
+def get_catalogue():
+    '''Function to get the current catalogue, reading the main log file only the first time.
+    The returned DataFrame is shared, so never modify it in place.'''
+
+    global _catalogue, _version
+
+    with _lock:
+        if _catalogue is None:
+            _version = files_version(scan_files())
+            _catalogue = read_catalogue()
+
+        return _catalogue
+
+
+def catalogue_version():
+    '''Function to get a token that changes whenever the log book or any data file changes.'''
+
+    get_catalogue()
+
+    return _version
+
+
+def swap_catalogue(df, version):
+    '''Function to replace the catalogue (and its version) in one step. Callbacks that are running keep the catalogue they already have.'''
+
+    global _catalogue, _version
+
+    with _lock:
+        _catalogue, _version = df, version
+
+
+def reaction_index(df=None):
+    '''Function to get the reaction search index (see utils/reaction_index.py) of a catalogue (default: the current one).
+    The index is built the first time it is needed and kept for the last few catalogues, so a reload builds a new one.'''
+
+    return _per_catalogue(_reaction_indexes, ReactionIndex, df)
+
+
+def catalogue_arrays(df=None):
+    '''Function to get the column arrays (see utils/records.py) of a catalogue (default: the current one).
+    They are built the first time they are needed and kept for the last few catalogues, like the reaction index.'''
+
+    return _per_catalogue(_catalogue_arrays, CatalogueArrays, df)
+
+
+def _per_catalogue(built, build, df):
+    if df is None:
+        df = get_catalogue()
+
+    with _lock:
+        entry = built.get(id(df))
+        if entry is not None:
+            built.move_to_end(id(df))
+            return entry[1]
+
+    value = build(df)
+
+    with _lock:
+        # the DataFrame is kept with its value, so that its id cannot be reused by another one.
+        built[id(df)] = (df, value)
+        while len(built) > CATALOGUE_CACHE_SIZE:
+            built.popitem(last=False)
+
+    return value
+
+
+def filter_catalogue(df, Z=None, A=None, methods=None, reaction=None, statuses=None):
+    '''Function to select the data sets that match the search criteria. Criteria that are None (or empty) are not applied.
+    Inputs: catalogue, proton number, mass number, list of methods, (part of a) reaction, list of statuses.
+    Output: the matching rows of the catalogue.'''
+
+    mask = pd.Series(True, index=df.index)
+
+    if Z is not None:
+        mask &= df['Z'] == Z
+
+    if A is not None:
+        mask &= df['A'] == A
+
+    if methods:
+        mask &= df['Method'].isin(methods)
+
+    if reaction:
+        mask &= df.index.isin(reaction_index(df).labels(reaction))
+
+    if statuses:
+        mask &= df['Status'].isin(statuses)
+
+    return df[mask]
+
+
+def selected_records(names):
+    '''Function to get the log book rows of the data sets with the given IDs (the Name column), in the given order.
+    IDs that are not in the catalogue (any more) are skipped.
+    Output: list of records (see utils/records.Record), read like dictionaries, e.g. record['Datafile'].'''
+
+    return catalogue_arrays().records(names)
+
+
+# ------------------------------------------ server-side paging of the data table ------------------------------------------
+
+# Operators of the filter row of dash_table.DataTable (filter_query), e.g. "{Z} s> 20 && {Method} contains Oslo".
+FILTER_OPERATORS = [['ge ', '>='], ['le ', '<='], ['lt ', '<'], ['gt ', '>'], ['ne ', '!='], ['eq ', '='], ['contains '],
+                    ['datestartswith ']]
+
+# Number of different queries (filters + sorting) whose index is kept per process.
+QUERY_CACHE_SIZE = 256
+
+
+def split_filter_part(filter_part):
+    '''Function to split one part of a filter query into column, operator and value (e.g. "{Z} s> 20" -> ("Z", "gt", 20.0)).
+    The value of a comparison is a number when it reads as one; the text of contains and datestartswith is kept as
+    written (e.g. "{Reference} contains 2019" -> ("Reference", "contains", "2019")).
+    Output: tuple (column, operator, value), or (None, None, None) if the part is not understood.'''
+
+    for operator_type in FILTER_OPERATORS:
+        for operator in operator_type:
+            if operator in filter_part:
+                name_part, value_part = filter_part.split(operator, 1)
+                name = name_part[name_part.find('{') + 1: name_part.rfind('}')]
+
+                value_part = value_part.strip()
+                if value_part and value_part[0] == value_part[-1] and value_part[0] in ('"', "'", '`'):
+                    value = value_part[1:-1].replace('\\' + value_part[0], value_part[0])
+                elif operator_type[0] in ('contains ', 'datestartswith '):
+                    value = value_part
+                else:
+                    try:
+                        value = float(value_part)
+                    except ValueError:
+                        value = value_part
+
+                # "s>", "s<" etc. are written by the table for numeric columns; the operator is what matters.
+                return name, operator_type[0].strip(), value
+
+    return None, None, None
+
+
+def apply_filter_query(df, filter_query):
+    '''Function to apply the filter row of the data table (filter_action='custom') to the catalogue.
+    Output: the matching rows. Parts of the query that are not understood (or name unknown columns) are ignored.'''
+
+    if not filter_query:
+        return df
+
+    mask = pd.Series(True, index=df.index)
+
+    for filter_part in filter_query.split(' && '):
+        column, operator, value = split_filter_part(filter_part)
+        if column not in df.columns:
+            continue
+
+        values = df[column]
+        if operator == 'contains':
+            mask &= values.astype(str).str.contains(str(value), case=False, regex=False, na=False)
+        elif operator == 'datestartswith':
+            mask &= values.astype(str).str.startswith(str(value), na=False)
+        else:
+            if pd.api.types.is_numeric_dtype(values):
+                try:
+                    value = float(value)
+                except ValueError:
+                    # e.g. "{Z} s> abc": no number compares with a value that is not a number.
+                    return df.iloc[:0]
+            elif isinstance(value, float):
+                values = pd.to_numeric(values, errors='coerce')
+            else:
+                # text columns are compared as text (they may hold missing values or numbers too).
+                values = values.astype(str).where(values.notna())
+            with np.errstate(invalid='ignore'):
+                mask &= {'ge': values.ge, 'le': values.le, 'lt': values.lt, 'gt': values.gt, 'ne': values.ne, 'eq': values.eq}[operator](value)
+
+    return df[mask]
+
+
+@functools.lru_cache(maxsize=QUERY_CACHE_SIZE)
+def _query_index(version, Z, A, methods, reaction, statuses, sort_by, filter_query):
+    df = _catalogue_of_version(version)
+
+    df = apply_filter_query(filter_catalogue(df, Z=Z, A=A, methods=list(methods), reaction=reaction, statuses=list(statuses)),
+                            filter_query)
+
+    if sort_by:
+        columns = [column for column, _ in sort_by if column in df.columns]
+        df = df.sort_values(columns, ascending=[direction == 'asc' for column, direction in sort_by if column in df.columns],
+                            kind='mergesort', na_position='last')
+
+    positions = _catalogue_of_version(version).index.get_indexer(df.index)
+    positions.flags.writeable = False
+
+    return positions
+
+
+def _catalogue_of_version(version):
+    with _lock:
+        if version != _version:
+            raise LookupError('the catalogue has been reloaded')
+        return _catalogue
+
+
+def query_catalogue(Z=None, A=None, methods=None, reaction=None, statuses=None, sort_by=None, filter_query=None):
+    '''Function to get the rows of the current catalogue that match the search criteria of the database page
+    (see filter_catalogue) and the filter row of the data table, in the order the table is sorted by.
+    The order of the rows (an array of row positions) is computed once per query and catalogue version, so paging
+    through the results only slices it.
+    Inputs: the search criteria, sort_by of the data table ([{'column_id': ..., 'direction': 'asc' | 'desc'}, ...]), filter_query of the data table.
+    Output: the matching rows of the catalogue (pandas DataFrame).'''
+
+    key = (tuple(methods or ()), reaction or None, tuple(statuses or ()),
+           tuple((s['column_id'], s['direction']) for s in sort_by or ()), filter_query or None)
+
+    get_catalogue()
+
+    while True:
+        with _lock:
+            df, version = _catalogue, _version
+        try:
+            return df.iloc[_query_index(version, Z, A, *key)]
+        except LookupError:
+            # the catalogue was swapped in the meantime (see utils/watcher.py), query the new one.
+            continue
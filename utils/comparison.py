@@ -0,0 +1,131 @@
+'''
+Comparison of data sets of the same nucleus on a common energy grid.
+
+Every data set is interpolated once onto the same fixed energy grid (COMPARISON_GRID), linearly in log(NLD), and
+the result is kept per data set (and version of its data file) in the shared cache of the workers and background jobs
+(see utils/cache.py). Comparing a selection then only stacks the grids of
+its data sets into one (n_datasets, n_energies) array and computes everything with array operations on it:
+
+- the weighted average of log(NLD) at every energy (weights 1/sigma^2 of log(NLD)) and its uncertainty,
+- the ratio of every data set to the weighted average where data sets overlap, with its uncertainty (the correlation with the average is included).
+
+Uncertainties are propagated in log space: sigma = dNLD/NLD at the data points, combined in quadrature by the interpolation.
+Energies outside the range of a data set (no extrapolation) and points with NLD <= 0 are left out (nan).
+'''
+
+import numpy as np
+from utils.cache import cache, CACHE_EXPIRE
+from utils.data_store import load_nld_data, dataset_version
+
+
+# Common energy grid (MeV) of all comparisons, in steps of 0.1 MeV. It covers the energies of the archive (-1 to 24 MeV).
+COMPARISON_GRID = np.linspace(-1.0, 25.0, 261)
+
+
+def interpolate_log(datasets, grid=COMPARISON_GRID):
+    '''Function to interpolate many data sets at once onto an energy grid, linearly in log(NLD).
+    The data sets are padded into one 2D array and located on the grid with a single searchsorted call
+    (every row is shifted by its own offset, so the rows do not mix).
+    Inputs: list of (E, NLD, dNLD) arrays, energy grid.
+    Output: log(NLD) and its uncertainty on the grid, two arrays of shape (n_datasets, len(grid)) with nan where a data set has no data.'''
+
+    n = len(datasets)
+    cleaned = []
+    for E, nld, dnld in datasets:
+        ok = (nld > 0) & np.isfinite(E) & np.isfinite(nld)
+        order = np.argsort(E[ok], kind='stable')
+        cleaned.append((E[ok][order], np.log(nld[ok][order]), (np.abs(dnld[ok]) / nld[ok])[order]))
+
+    length = max([len(E) for E, _, _ in cleaned] + [2])
+
+    # padded arrays: energies past the end of a data set are +inf, so searchsorted never lands beyond its last point.
+    E = np.full((n, length), np.inf)
+    y = np.zeros((n, length))
+    sigma = np.zeros((n, length))
+    counts = np.zeros(n, dtype=int)
+    for k, (E_k, y_k, s_k) in enumerate(cleaned):
+        counts[k] = len(E_k)
+        E[k, :len(E_k)], y[k, :len(E_k)], sigma[k, :len(E_k)] = E_k, y_k, s_k
+
+    # one searchsorted over all rows: row k is shifted by k * span, so every row is sorted and after the previous one.
+    span = 2 * (np.abs(grid).max() + np.abs(E[np.isfinite(E)]).max(initial=0) + 1)
+    offsets = span * np.arange(n)[:, None]
+    flat = np.where(np.isfinite(E), E + offsets, offsets + span / 2).ravel()
+    position = np.searchsorted(flat, (grid[None, :] + offsets).ravel(), side='right').reshape(n, len(grid)) - length * np.arange(n)[:, None]
+
+    # neighbouring points (left, right) of every grid energy and the interpolation weight t.
+    right = np.clip(position, 1, np.maximum(counts - 1, 1)[:, None])
+    left = right - 1
+    rows = np.arange(n)[:, None]
+    E_left, E_right = E[rows, left], E[rows, right]
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        t = np.where(E_right > E_left, (grid[None, :] - E_left) / (E_right - E_left), 0.0)
+        log_nld = (1 - t) * y[rows, left] + t * y[rows, right]
+        dlog_nld = np.sqrt(((1 - t) * sigma[rows, left])**2 + (t * sigma[rows, right])**2)
+
+    first = E[:, 0:1]
+    last = E[rows[:, 0], np.maximum(counts - 1, 0)][:, None]
+    inside = (counts[:, None] >= 2) & (grid[None, :] >= first) & (grid[None, :] <= last)
+
+    return np.where(inside, log_nld, np.nan), np.where(inside, dlog_nld, np.nan)
+
+
+def interpolated_datasets(datafiles):
+    '''Function to get the data sets on the common grid (see interpolate_log), interpolating only the ones that are not cached yet
+    (or whose data file changed).
+    Input: list of data files.
+    Output: log(NLD) and its uncertainty, two arrays of shape (len(datafiles), len(COMPARISON_GRID)).'''
+
+    keys = [('comparison-grid', datafile, dataset_version(datafile)) for datafile in datafiles]
+    grids = {key: cache.get(key) for key in keys}
+
+    # the grids are tagged with their data file like the fits, so the watcher evicts them when the file changes.
+    missing = [key for key, grid in grids.items() if grid is None]
+    if missing:
+        log_nld, dlog_nld = interpolate_log([load_nld_data(key[1]) for key in missing])
+        for k, key in enumerate(missing):
+            grids[key] = (log_nld[k], dlog_nld[k])
+            cache.set(key, grids[key], expire=CACHE_EXPIRE, tag=key[1])
+
+    return np.stack([grids[key][0] for key in keys]), np.stack([grids[key][1] for key in keys])
+
+
+def compare_datasets(datafiles):
+    '''Function to compare data sets (usually of the same nucleus) on the common energy grid.
+    Input: list of data files.
+    Output: dictionary with the grid energies where at least one data set has data, and on them: NLD and its uncertainty of every data set
+    (arrays of shape (n_datasets, n_energies)), the weighted average and its uncertainty, the ratio of every data set to the
+    weighted average and its uncertainty, and the number of data sets at every energy.'''
+
+    log_nld, dlog_nld = interpolated_datasets(datafiles)
+
+    has_data = np.isfinite(log_nld) & np.isfinite(dlog_nld) & (dlog_nld > 0)
+    columns = has_data.any(axis=0)
+    log_nld, dlog_nld, has_data = log_nld[:, columns], dlog_nld[:, columns], has_data[:, columns]
+
+    # weighted average of log(NLD) over the data sets (weights 1/sigma^2), energy by energy.
+    with np.errstate(divide='ignore', invalid='ignore'):
+        weights = np.where(has_data, 1 / dlog_nld**2, 0.0)
+        total_weight = weights.sum(axis=0)
+        mean = np.where(has_data, weights * log_nld, 0.0).sum(axis=0) / total_weight
+        dmean = 1 / np.sqrt(total_weight)
+
+        # ratio to the average (only where at least 2 data sets overlap):
+        # sigma^2(log_k - mean) = sigma_k^2 - sigma_mean^2, because the average contains the data set itself.
+        n_datasets = has_data.sum(axis=0)
+        log_ratio = np.where(n_datasets >= 2, log_nld - mean, np.nan)
+        dlog_ratio = np.sqrt(np.maximum(dlog_nld**2 - dmean**2, 0.0))
+
+    nld = np.exp(log_nld)
+
+    return {
+        'E': COMPARISON_GRID[columns],
+        'nld': nld,
+        'dnld': nld * dlog_nld,
+        'mean': np.exp(mean),
+        'dmean': np.exp(mean) * dmean,
+        'ratio': np.exp(log_ratio),
+        'dratio': np.exp(log_ratio) * dlog_ratio,
+        'n_datasets': n_datasets,
+    }
@@ -0,0 +1,108 @@
+'''
+Cached access to the level density data files (Accepted/, Probation/, ...).
+
+Every data file is parsed once per process and kept as read-only numpy arrays, so the plotting,
+fitting and download callbacks do not have to re-read the csv files on every request.
+'''
+
+import os
+import threading
+import numpy as np
+import pandas as pd
+from utils.catalogue import resolve_path
+
+
+# Relative uncertainty assumed when a data file lists no (or zero) uncertainty.
+DEFAULT_RELATIVE_ERROR = 0.2
+
+_nld_arrays = {}
+_lock = threading.Lock()
+
+
+def read_nld_file(datafile):
+    '''Function to read a level density data file.
+    The files have 2 or 3 columns (energy, level density and optionally its uncertainty) and may contain comment lines starting with #.
+    Input: path of the data file.
+    Output: energies (MeV), level densities (1/MeV) and their uncertainties as numpy arrays.
+    A missing or zero uncertainty is replaced by 20% of the level density.'''
+
+    nld_data = pd.read_csv(datafile, header=None, sep=',', comment='#')
+
+    E = nld_data[0].to_numpy(dtype=float)
+    nld = nld_data[1].to_numpy(dtype=float)
+    dnld = nld_data[2].to_numpy(dtype=float) if nld_data.shape[1] > 2 else np.zeros_like(nld)
+
+    dnld = np.where(np.isnan(dnld) | (dnld == 0), DEFAULT_RELATIVE_ERROR * nld, dnld)
+
+    # the arrays are shared between callbacks (and threads), so nobody is allowed to modify them in place.
+    for array in (E, nld, dnld):
+        array.flags.writeable = False
+
+    return E, nld, dnld
+
+
+def file_version(path):
+    '''Function to get a token that changes whenever the file changes (modification time and size).'''
+
+    stat = os.stat(path)
+
+    return f'{stat.st_mtime_ns}-{stat.st_size}'
+
+
+def load_nld_data(datafile):
+    '''Function to get the arrays of a level density data file, reading the file only the first time it is requested.
+    Input: path of the data file (the Datafile column of the log book, see utils/catalogue.resolve_path).
+    Output: energies, level densities and their uncertainties (read-only numpy arrays).'''
+
+    return _get_entry(datafile)[1]
+
+
+def dataset_version(datafile):
+    '''Function to get the version of the data file whose arrays load_nld_data returns.
+    It is part of the cache keys of the fits, so results computed from an older version of the file are never used.'''
+
+    return _get_entry(datafile)[0]
+
+
+def _get_entry(datafile):
+    with _lock:
+        entry = _nld_arrays.get(datafile)
+
+    if entry is None:
+        path = resolve_path(datafile)
+        entry = (file_version(path), read_nld_file(path))
+        with _lock:
+            entry = _nld_arrays.setdefault(datafile, entry)
+
+    return entry
+
+
+def reload(datafile):
+    '''Function to read a data file again (after it changed on disk) and replace its cached arrays in one step,
+    so the next request gets the new arrays without having to wait for the file to be read.'''
+
+    path = resolve_path(datafile)
+    entry = (file_version(path), read_nld_file(path))
+
+    with _lock:
+        _nld_arrays[datafile] = entry
+
+
+def invalidate(datafile=None):
+    '''Function to forget the cached arrays of a data file (or of all data files if no file is given),
+    e.g. after the file has been removed.'''
+
+    with _lock:
+        if datafile is None:
+            _nld_arrays.clear()
+        else:
+            _nld_arrays.pop(datafile, None)
+
+
+def fit_window(E, nld, dnld, E_min, E_max):
+    '''Function to select the points used for fitting (Emin < E < Emax + 0.1 MeV, the same window as the website has always used).
+    Output: energies, level densities and uncertainties inside the window.'''
+
+    mask = (E > E_min) & (E < E_max + 0.1)
+
+    return E[mask], nld[mask], dnld[mask]
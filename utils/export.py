@@ -0,0 +1,213 @@
+'''
+Whole-archive export: the catalogue, the arrays of every data set and their fits in one file.
+
+Downloading the whole archive through the website (select everything, then the zip download) reads every csv file,
+writes it into a zip and sends it base64 encoded through a callback. Instead, the archive is written once per
+catalogue version (utils/catalogue.catalogue_version) into a single uncompressed numpy .npz file, which the Flask
+server sends as a static file (/downloads/nld_archive.npz, see serve_archive), so a full download costs the server
+only the file transfer. utils/watcher.py writes the file of a new catalogue right after swapping it in.
+
+The file is columnar, every entry is one flat array (np.load(path)[key], no pickle needed):
+
+    format_version, catalogue_version     0-d string arrays
+    columns                               names of the catalogue columns, in order
+    catalogue/<column>                    one array per column (numbers as float64/int64, text as unicode, missing text is '')
+    offsets                               int64 offset index: data set k is E[offsets[k]:offsets[k + 1]] (same for NLD, dNLD)
+    E, NLD, dNLD                          the arrays of all data sets, concatenated in catalogue order (sorted by energy)
+    fits/<model>/<parameter>              cached least squares fits (CTM, BSFG, GC) of every data set, nan where the fit fails
+    fits/<model>/<parameter>_error        and their errors
+
+read_archive reads it back into a catalogue DataFrame and a dictionary of (n, 3) arrays.
+
+Run from the repository root to write the file of the current archive:
+
+    python -m utils.export                  # into NLD_EXPORT_DIR (default: <cache directory>/export)
+    python -m utils.export --output nld_archive.npz
+'''
+
+import os
+import sys
+import glob
+import argparse
+import warnings
+import numpy as np
+import pandas as pd
+from flask import send_file, redirect, request
+from utils.cache import CACHE_DIR, single_flight
+from utils.catalogue import get_catalogue, catalogue_version
+from utils.data_store import load_nld_data
+from utils.fits import cached_fit, FIT_MODELS, PARAMETER_NAMES
+
+
+ARCHIVE_FORMAT = '1'
+
+ARCHIVE_NAME = 'nld_archive.npz'
+
+EXPORT_DIR = os.environ.get('NLD_EXPORT_DIR', os.path.join(CACHE_DIR, 'export'))
+
+
+def archive_path(version):
+    '''Function to get the path of the archive file of a catalogue version.'''
+
+    return os.path.join(EXPORT_DIR, f'nld_archive_{version}.npz')
+
+
+def catalogue_columns(df):
+    '''Function to turn the catalogue into one flat array per column (no object arrays, so the file loads without pickle).'''
+
+    columns = {}
+    for column in df.columns:
+        values = df[column]
+        if pd.api.types.is_numeric_dtype(values) and not pd.api.types.is_bool_dtype(values):
+            columns[column] = values.to_numpy()
+        else:
+            columns[column] = np.array([str(value) if pd.notna(value) else '' for value in values], dtype=str)
+
+    return columns
+
+
+def fit_columns(df):
+    '''Function to get the cached fits of every data set as columns {(model, parameter): array}, nan where the fit fails.'''
+
+    columns = {}
+    for model in FIT_MODELS:
+        names = PARAMETER_NAMES[model]
+        values = np.full((len(df), 2 * len(names)), np.nan)
+
+        for k, row in enumerate(df[['Datafile', 'Emin', 'Emax', 'A']].itertuples(index=False)):
+            try:
+                with warnings.catch_warnings():
+                    warnings.simplefilter('ignore')
+                    fit = cached_fit(row.Datafile, model, row.Emin, row.Emax, row.A)
+            except Exception:
+                continue
+            values[k] = [fit['parameters'][name] for name in names] + [fit['errors'][name] for name in names]
+
+        for j, name in enumerate(names):
+            columns[(model, name)] = values[:, j]
+            columns[(model, name + '_error')] = values[:, len(names) + j]
+
+    return columns
+
+
+def write_archive(path, df=None, version=None):
+    '''Function to write the archive file (see the module docstring).
+    Inputs: path of the file, catalogue and its version (default: the current ones).
+    The file is written next to its final path and renamed at the end, so nobody ever reads a half written file.'''
+
+    if df is None:
+        df, version = get_catalogue(), catalogue_version()
+
+    arrays = [load_nld_data(datafile) for datafile in df['Datafile']]
+    offsets = np.zeros(len(arrays) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(E) for E, _, _ in arrays])
+
+    entries = {
+        'format_version': np.array(ARCHIVE_FORMAT),
+        'catalogue_version': np.array(str(version)),
+        'columns': np.array(list(df.columns), dtype=str),
+        'offsets': offsets,
+    }
+    for k, name in enumerate(('E', 'NLD', 'dNLD')):
+        entries[name] = np.concatenate([array[k] for array in arrays]).astype(np.float64) if arrays else np.zeros(0)
+    for column, values in catalogue_columns(df).items():
+        entries[f'catalogue/{column}'] = values
+    for (model, name), values in fit_columns(df).items():
+        entries[f'fits/{model}/{name}'] = values
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    temporary = f'{path}.{os.getpid()}.tmp'
+    with open(temporary, 'wb') as f:
+        np.savez(f, **entries)
+    os.replace(temporary, path)
+
+    return path
+
+
+def build_archive():
+    '''Function to make sure the archive file of the current catalogue exists, writing it only if the data changed.
+    Only one process writes it at a time (the others wait for it), and the files of older versions are removed.
+    Output: path of the file.'''
+
+    version = catalogue_version()
+    path = archive_path(version)
+
+    if not os.path.isfile(path):
+        single_flight.do(('archive', version), _write_current_archive, version)
+
+    return path
+
+
+def _write_current_archive(version):
+    path = archive_path(version)
+
+    if not os.path.isfile(path):
+        df = get_catalogue()
+        # the catalogue may have been swapped since the version was read, the file is only written for a matching pair.
+        if catalogue_version() == version:
+            write_archive(path, df, version)
+
+    for old in glob.glob(os.path.join(EXPORT_DIR, 'nld_archive_*.npz')):
+        if old != path:
+            try:
+                os.remove(old)
+            except OSError:
+                pass
+
+    return path
+
+
+def archive_url():
+    '''Function to get the versioned (cacheable forever) URL of the archive file.'''
+
+    return f'/downloads/{ARCHIVE_NAME}?v={catalogue_version()}'
+
+
+def serve_archive():
+    '''View that sends the archive file of the current catalogue (see archive_url).
+    Requests without the current version are redirected to the versioned URL.'''
+
+    version = catalogue_version()
+    if request.args.get('v') != version:
+        return redirect(archive_url())
+
+    path = build_archive()
+    if not os.path.isfile(path):
+        # the catalogue changed while the file was written: start again with the new version.
+        return redirect(archive_url())
+
+    # the version is the ETag, so the file is never read to hash it (see utils/http_cache.py).
+    return send_file(os.path.abspath(path), mimetype='application/octet-stream', download_name=ARCHIVE_NAME, etag=version)
+
+
+def read_archive(path):
+    '''Function to read an archive file.
+    Output: the catalogue (pandas DataFrame), {Name: (n, 3) array with the columns E, NLD, dNLD} and the fits
+    {model: DataFrame of the parameters and their errors, one row per data set}.'''
+
+    with np.load(path) as archive:
+        df = pd.DataFrame({str(column): archive[f'catalogue/{column}'] for column in archive['columns']})
+        offsets = archive['offsets']
+        data = np.column_stack([archive['E'], archive['NLD'], archive['dNLD']])
+        fits = {model: pd.DataFrame({key.split('/')[2]: archive[key] for key in archive.files if key.startswith(f'fits/{model}/')})
+                for model in FIT_MODELS}
+
+    arrays = {name: data[offsets[k]:offsets[k + 1]] for k, name in enumerate(df['Name'])}
+
+    return df, arrays, fits
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Write the whole archive (catalogue, arrays and fits) into one .npz file.')
+    parser.add_argument('--output', default=None, help=f'file to write (default: the served file in {EXPORT_DIR})')
+    args = parser.parse_args(argv)
+
+    path = write_archive(args.output) if args.output else build_archive()
+
+    print(f'{path}: {os.path.getsize(path) / 1e6:.1f} MB', file=sys.stderr)
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
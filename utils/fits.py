@@ -0,0 +1,64 @@
+'''
+Least squares fits of the data sets, cached in the shared cache (utils/cache.py).
+
+The website (pages/search_Z_A.py) and the REST API (utils/api.py) both get their CT, BSFG and Gilbert-Cameron
+fits from here, so a data set is fitted only once per fitting window and model.
+'''
+
+import numpy as np
+from utils.cache import cache, CACHE_EXPIRE
+from utils.data_store import load_nld_data, dataset_version, fit_window
+from utils.fitting_functions import ctm_fit, bsfg_fit, gilbert_cameron_fit, gilbert_cameron_matching
+
+
+FIT_MODELS = ('CTM', 'BSFG', 'GC')
+
+PARAMETER_NAMES = {'CTM': ('T', 'E0'), 'BSFG': ('a', 'Delta'), 'GC': ('T', 'a', 'Delta')}
+
+
+def fit_dataset(datafile, model, E_min, E_max, A):
+    '''Function to fit a data set to the CT, BSFG or Gilbert-Cameron model.
+    Inputs: data file, model ('CTM', 'BSFG' or 'GC'), minimum and maximum energy of fitting, mass number.
+    Output: dictionary with the best fit parameters and their errors (plain floats, so it can be cached and sent as JSON).
+    For the Gilbert-Cameron model the matching energy Ex and the CT shift E0 are included too.'''
+
+    x, y, dy = fit_window(*load_nld_data(datafile), E_min, E_max)
+
+    if model == 'CTM':
+        popt, pcov = ctm_fit(x, y, dy)
+    elif model == 'BSFG':
+        popt, pcov = bsfg_fit(x, y, dy, A)
+    else:
+        popt, pcov = gilbert_cameron_fit(x, y, dy, A)
+
+    param_errors = np.sqrt(np.diag(pcov))
+
+    result = {
+        'model': model,
+        'parameters': {name: float(popt[k]) for k, name in enumerate(PARAMETER_NAMES[model])},
+        'errors': {name: float(param_errors[k]) for k, name in enumerate(PARAMETER_NAMES[model])},
+    }
+
+    if model == 'GC':
+        Ex, E0 = gilbert_cameron_matching(*popt, A)
+        result['Ex'], result['E0'] = float(Ex), float(E0)
+
+    return result
+
+
+def cached_fit(datafile, model, E_min, E_max, A):
+    '''Function to get the fit of a data set (see fit_dataset), fitting it only the first time it is requested.
+    The result is cached by (Datafile, model, fitting window, mass number) and the version of the data file, and tagged with
+    the data file so utils/watcher.py can drop it when the data set changes.'''
+
+    # A is part of the key: the BSFG and GC fits depend on it, and it can change in the log book without the data file changing
+    # (a worker whose watcher has not seen the new log book yet would otherwise store a fit with the old A under the same key).
+    key = ('fit', datafile, model, float(E_min), float(E_max), int(A), dataset_version(datafile))
+
+    result = cache.get(key)
+
+    if result is None:
+        result = fit_dataset(datafile, model, float(E_min), float(E_max), int(A))
+        cache.set(key, result, expire=CACHE_EXPIRE, tag=datafile)
+
+    return result
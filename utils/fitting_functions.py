@@ -1,4 +1,5 @@
 import numpy as np
+from scipy.optimize import curve_fit
 
 def liquid_drop_mass(A,Z):
 	N = A - Z
@@ -68,3 +69,135 @@ def bsfg_fitting(E, a, Delta, A):
 def ctm_fitting(x_data,T,E0):
 
     return 1/T * np.exp((x_data - E0)/T)
+
+
+
+def ctm_log_density(E, T, E0):
+    '''Natural log of ctm_fitting. Broadcasts over the parameters, so it can be evaluated for many parameter sets at once.'''
+
+    return (np.asarray(E, dtype=float) - E0) / T - np.log(T)
+
+
+def ctm_fit(x, y, dy):
+    '''Function to fit a data set to the CT model.
+    Inputs: energies, level densities and their uncertainties inside the fitting window.
+    Outputs: best fit parameters (T, E0) and their covariance matrix.'''
+
+    return curve_fit(ctm_fitting, xdata=x, ydata=y, sigma=dy, absolute_sigma=True)
+
+
+def bsfg_bounds(x):
+    '''Parameter bounds of the BSFG fit: a > 0 and Delta below the lowest fitted energy
+    (a Delta that is >= all E would make rho = 0).'''
+
+    return ([1e-6, -50.0], [1e3, np.min(x) - 1e-6])
+
+
+def bsfg_fit(x, y, dy, A):
+    '''Function to fit a data set to the BSFG model, with bounds and an initial guess that avoid non-physical solutions.
+    Inputs: energies, level densities and their uncertainties inside the fitting window, mass number.
+    Outputs: best fit parameters (a, Delta) and their covariance matrix.'''
+
+    p0 = [max(1e-6, A/8.0), np.min(x)/2.0]
+
+    return curve_fit(lambda E, a, Delta: bsfg_fitting(E, a, Delta, A), xdata=x, ydata=y,
+                     sigma=dy, absolute_sigma=True, p0=p0, bounds=bsfg_bounds(x), maxfev=10000)
+
+
+# ------------------------------------------ Gilbert-Cameron (composite) model ------------------------------------------
+
+# Candidate grid of energies above the back-shift (U = E - Delta, in MeV) on which the
+# CT/BSFG matching point is searched. The grid is logarithmic because the matching point
+# sits close to the back-shift for large level density parameters.
+GC_MATCHING_GRID = np.geomspace(1e-2, 1e2, 1024)
+
+
+def bsfg_log_density(E, a, Delta, A):
+    '''Natural log of bsfg_fitting. Unlike bsfg_fitting this broadcasts over the parameters as well,
+    so it can be evaluated for many parameter sets at once. Returns -inf where E <= Delta.'''
+
+    U = np.asarray(E, dtype=float) - Delta
+    a_tilde = 0.0722396 * A + 0.195267 * A**(2/3)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        U_pos = np.where(U > 0, U, np.nan)
+        log_sigma = 0.5 * np.log(0.01389 * A**(5/3) / a_tilde * np.sqrt(U_pos * a))
+        log_rho = (-log_sigma - 0.5 * np.log(2 * np.pi) + np.log(np.sqrt(np.pi) / 12) +
+                   2 * np.sqrt(a * U_pos) - 0.25 * np.log(a) - 1.25 * np.log(U_pos))
+
+    return np.where(U > 0, log_rho, -np.inf)
+
+
+def bsfg_log_derivative(U, a):
+    '''d ln(rho_BSFG)/dE of bsfg_fitting at U = E - Delta > 0 (the inverse nuclear temperature).'''
+
+    return np.sqrt(a / U) - 1.5 / U
+
+
+def gilbert_cameron_matching(T, a, Delta, A, U_grid=GC_MATCHING_GRID):
+    '''Function to find the energy where the CT model joins the BSFG model.
+    At the matching energy Ex the log-derivative of the BSFG density equals 1/T, and E0 is then chosen
+    so that both densities have the same value at Ex.
+
+    The log-derivative is evaluated on the whole candidate grid at once and the sign change is
+    interpolated linearly, so no scalar root finder is needed. T, a, Delta and A can be scalars or
+    arrays (one entry per parameter set), which lets the matching be done for a whole batch of datasets in one call.
+    If 1/T is larger than the maximum of the log-derivative (a/6) there is no matching point, and the
+    point of closest approach is used instead so the composite stays continuous.
+
+    Inputs: T (MeV), a (1/MeV), Delta (MeV), A, candidate grid of U = E - Delta.
+    Outputs: matching energy Ex and CT energy shift E0 (same shape as the broadcast parameters).'''
+
+    T, a, Delta, A = np.broadcast_arrays(*(np.asarray(p, dtype=float) for p in (T, a, Delta, A)))
+
+    # g has shape (..., len(U_grid)). The derivative rises to a maximum at U = 9/a and falls afterwards;
+    # the physical matching point is the crossing on the falling branch.
+    g = bsfg_log_derivative(U_grid, a[..., None]) - 1 / T[..., None]
+    crossing = (g[..., :-1] >= 0) & (g[..., 1:] < 0)
+    has_root = crossing.any(axis=-1)
+
+    idx = np.where(has_root, np.argmax(crossing, axis=-1), np.argmax(g, axis=-1))[..., None]
+    idx_next = np.minimum(idx + 1, len(U_grid) - 1)
+
+    g0 = np.take_along_axis(g, idx, axis=-1)[..., 0]
+    g1 = np.take_along_axis(g, idx_next, axis=-1)[..., 0]
+    U0, U1 = U_grid[idx[..., 0]], U_grid[idx_next[..., 0]]
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        U_root = U0 + g0 * (U1 - U0) / (g0 - g1)
+    U_match = np.where(has_root, U_root, U0)
+
+    Ex = Delta + U_match
+    E0 = Ex - T * (np.log(T) + bsfg_log_density(Ex, a, Delta, A))
+
+    return Ex, E0
+
+
+def gilbert_cameron_fitting(E, T, a, Delta, A):
+    '''Composite Gilbert-Cameron level density: CT model below the matching energy and BSFG model above it.'''
+
+    E = np.asarray(E, dtype=float)
+    Ex, E0 = gilbert_cameron_matching(T, a, Delta, A)
+
+    log_rho = np.where(E < Ex, (E - E0) / T - np.log(T), bsfg_log_density(E, a, Delta, A))
+
+    return np.exp(log_rho)
+
+
+def gilbert_cameron_fit(x, y, dy, A):
+    '''Function to fit a data set to the Gilbert-Cameron model.
+    The starting temperature is taken from the log-slope of the data and the starting level density parameter
+    is chosen so that a matching point exists (a > 6/T).
+    Inputs: energies, level densities and their uncertainties inside the fitting window, mass number.
+    Outputs: best fit parameters (T, a, Delta) and their covariance matrix.'''
+
+    x, y, dy = (np.asarray(v, dtype=float) for v in (x, y, dy))
+
+    slope = np.polyfit(x, np.log(y), 1)[0] if len(x) > 1 else 0.0
+    T_start = np.clip(1 / slope, 0.3, 5.0) if slope > 0 else 1.0
+
+    p0 = [T_start, max(A / 8.0, 7.0 / T_start), np.min(x) / 2.0]
+    bounds = ([0.05, 1e-3, -50.0], [20.0, 1e3, np.max(x)])
+
+    return curve_fit(lambda E, T, a, Delta: gilbert_cameron_fitting(E, T, a, Delta, A), xdata=x, ydata=y,
+                     sigma=dy, absolute_sigma=True, p0=p0, bounds=bounds, maxfev=10000)
@@ -0,0 +1,210 @@
+'''
+HTTP caching and compression of the website's responses.
+
+Cloudflare is not allowed to transform our responses (see set_no_transform in app.py), so the app compresses
+them itself: large text/JSON responses (callback results with figures and table records, the javascript
+bundles of Dash) are sent gzip or brotli compressed when the browser accepts it.
+
+GET responses also get a content-hash ETag, so a browser that already has a resource gets a 304 (Not Modified)
+instead of the whole body. Resources whose URL contains a fingerprint (Dash component bundles, assets with ?m=,
+data files with ?v=<content hash>, the whole-archive file with ?v=<catalogue version>) never change and are served with a long max-age.
+'''
+
+import os
+import gzip
+import hashlib
+import threading
+from collections import OrderedDict
+from flask import request, send_file, abort, current_app
+from dash.fingerprint import check_fingerprint
+from utils.catalogue import DATA_DIRS, resolve_path, catalogue_version
+from utils.export import ARCHIVE_NAME, serve_archive
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+# Responses smaller than this are not worth compressing.
+MIN_COMPRESS_SIZE = 1024
+
+COMPRESSIBLE_MIMETYPES = {'text/html', 'text/css', 'text/plain', 'text/csv', 'text/javascript', 'application/javascript',
+                          'application/json', 'image/svg+xml'}
+
+# One year, the longest max-age browsers honour.
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+
+# Compressed bodies of immutable resources (mostly the Dash javascript bundles) are kept so they are compressed only once.
+MAX_CACHED_BODIES = 64
+
+_compressed_bodies = OrderedDict()
+_dataset_hashes = {}
+_lock = threading.Lock()
+
+
+def is_immutable(req):
+    '''Function to check if the requested resource can never change (its URL contains a fingerprint of its content).'''
+
+    if req.path.startswith('/_dash-component-suites/'):
+        return check_fingerprint(req.path)[1]
+
+    if req.path.startswith('/assets/'):
+        return 'm' in req.args
+
+    if req.path.startswith('/datasets/'):
+        return 'v' in req.args and req.args['v'] == dataset_hash(req.path[len('/datasets/'):])
+
+    if req.path == f'/downloads/{ARCHIVE_NAME}':
+        return 'v' in req.args and req.args['v'] == catalogue_version()
+
+    return False
+
+
+def compress(data, encoding):
+    '''Function to compress a response body with the given content coding ('br' or 'gzip').'''
+
+    if encoding == 'br':
+        return brotli.compress(data, quality=5)
+
+    return gzip.compress(data, compresslevel=6)
+
+
+def choose_encoding(req):
+    '''Function to pick the best content coding the browser accepts (None if it accepts neither brotli nor gzip).'''
+
+    if brotli is not None and req.accept_encodings['br']:
+        return 'br'
+
+    if req.accept_encodings['gzip']:
+        return 'gzip'
+
+    return None
+
+
+def add_etag_and_cache_headers(response):
+    '''Function to add a content-hash ETag (and a long max-age for immutable resources) to GET responses,
+    and to answer conditional requests (If-None-Match) with 304 Not Modified.'''
+
+    if request.method not in ('GET', 'HEAD') or response.status_code != 200 or (response.is_streamed and not response.direct_passthrough):
+        return response
+
+    immutable = is_immutable(request)
+
+    if response.get_etag()[0] is None:
+        # direct_passthrough responses (files) have to be read before the body can be hashed.
+        response.direct_passthrough = False
+        response.add_etag()
+
+    if immutable:
+        response.cache_control.no_cache = None
+        response.cache_control.public = True
+        response.cache_control.max_age = IMMUTABLE_MAX_AGE
+        response.cache_control.immutable = True
+
+    return response.make_conditional(request)
+
+
+def compress_response(response):
+    '''Function to compress large text/JSON responses with the best content coding the browser accepts.'''
+
+    if (response.status_code != 200 or 'Content-Encoding' in response.headers or response.mimetype not in COMPRESSIBLE_MIMETYPES
+            or (response.is_streamed and not response.direct_passthrough)):
+        return response
+
+    response.vary.add('Accept-Encoding')
+
+    encoding = choose_encoding(request)
+    if encoding is None:
+        return response
+
+    response.direct_passthrough = False
+    data = response.get_data()
+    if len(data) < MIN_COMPRESS_SIZE:
+        return response
+
+    key = (request.full_path, encoding) if is_immutable(request) else None
+
+    with _lock:
+        body = _compressed_bodies.get(key) if key else None
+
+    if body is None:
+        body = compress(data, encoding)
+        if key:
+            with _lock:
+                _compressed_bodies[key] = body
+                while len(_compressed_bodies) > MAX_CACHED_BODIES:
+                    _compressed_bodies.popitem(last=False)
+
+    response.set_data(body)
+    response.headers['Content-Encoding'] = encoding
+
+    # the compressed body differs from the identity body byte by byte, so the ETag becomes a weak one.
+    etag, weak = response.get_etag()
+    if etag is not None and not weak:
+        response.set_etag(etag, weak=True)
+
+    return response
+
+
+def http_cache_layer(response):
+    '''after_request hook: ETags, 304 answers and long max-age for immutable resources first, then compression.'''
+
+    try:
+        return compress_response(add_etag_and_cache_headers(response))
+    except Exception:
+        # Don't let header handling break the app: log it and send the response the view made. Both steps only change
+        # the body and headers once everything that can fail is done, so it is still a consistent response.
+        current_app.logger.exception('ETag/compression of %s %s failed', request.method, request.path)
+        return response
+
+
+# ------------------------------------------------- data file downloads --------------------------------------------------
+
+def dataset_hash(datafile):
+    '''Function to get a short content hash of a data file (recomputed only when the file changes on disk).
+    Returns None if the file is not a data file of the archive.'''
+
+    if datafile.split('/')[0] not in DATA_DIRS or '..' in datafile.split('/'):
+        return None
+
+    path = resolve_path(datafile)
+    if not os.path.isfile(path):
+        return None
+
+    mtime = os.stat(path).st_mtime_ns
+
+    with _lock:
+        cached = _dataset_hashes.get(datafile)
+
+    if cached is None or cached[0] != mtime:
+        with open(path, 'rb') as f:
+            cached = (mtime, hashlib.sha256(f.read()).hexdigest()[:16])
+        with _lock:
+            _dataset_hashes[datafile] = cached
+
+    return cached[1]
+
+
+def dataset_url(datafile):
+    '''Function to get the versioned (cacheable forever) URL of a data file.'''
+
+    return f'/datasets/{datafile}?v={dataset_hash(datafile)}'
+
+
+def serve_dataset(datafile):
+    '''View that serves a level density data file of the archive (see dataset_url).'''
+
+    if dataset_hash(datafile) is None:
+        abort(404)
+
+    return send_file(os.path.abspath(resolve_path(datafile)), mimetype='text/csv', conditional=False, etag=False)
+
+
+def init_http_cache(server):
+    '''Function to register the caching/compression layer, the data file route and the whole-archive download (utils/export.py) on the Flask server.
+    Register it after set_no_transform (app.py), Flask runs the after_request hooks in reverse order.'''
+
+    server.add_url_rule('/datasets/<path:datafile>', 'serve_dataset', serve_dataset)
+    server.add_url_rule(f'/downloads/{ARCHIVE_NAME}', 'serve_archive', serve_archive)
+    server.after_request(http_cache_layer)
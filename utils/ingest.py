@@ -0,0 +1,268 @@
+'''
+Ingest and validation of the level density data sets.
+
+Checks every row of the log book and its data file before it goes online, instead of finding problems as callback
+exceptions on the website. A data file has to parse, have 2 or 3 numeric columns (energy, level density and optionally
+its uncertainty), and its name (NLD_<Z>_<A>_<n>.csv) has to match the Z and A of its row. Unsorted or repeated energies,
+non-positive level densities and failing trial CT/BSFG fits over the Emin/Emax window of the row are reported as warnings.
+
+The files are checked in parallel (one process per core), so the whole archive takes a few seconds. Valid files can
+also be normalized (sorted by energy, missing uncertainties filled in as on the website) and written as (n, 3) float64
+.npy files, the same arrays the REST API serves with ?format=npy.
+
+Run from the repository root:
+
+    python -m utils.ingest                                  # validate the whole archive, JSON report on stdout
+    python -m utils.ingest --report report.json Accepted/NLD_26_57_1.csv
+    python -m utils.ingest --normalize tmp/normalized --jobs 4
+
+The exit code is 1 if any data set has errors, so the command can be run on every submission.
+'''
+
+import os
+import re
+import sys
+import json
+import time
+import argparse
+import warnings
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from utils.catalogue import LOG_BOOK, DATA_DIRS, resolve_path, read_catalogue
+from utils.data_store import DEFAULT_RELATIVE_ERROR, fit_window
+from utils.fitting_functions import ctm_fit, bsfg_fit
+
+
+DATAFILE_PATTERN = re.compile(r'^NLD_(\d+)_(\d+)_(\d+)\.csv$')
+
+TRIAL_FIT_MODELS = ('CTM', 'BSFG')
+
+# Files are handed to the worker processes in chunks, a single small file is not worth a round trip.
+CHUNK_SIZE = 8
+
+
+def parse_nld_file(path):
+    '''Function to read a data file without any correction, so that its problems can be reported.
+    Output: (n, 2 or 3) float array and the list of errors (the array is None if there are errors).'''
+
+    try:
+        nld_data = pd.read_csv(path, header=None, sep=',', comment='#')
+    except FileNotFoundError:
+        return None, ['data file not found']
+    except Exception as error:
+        return None, [f'cannot be parsed: {error}']
+
+    if nld_data.shape[1] not in (2, 3):
+        return None, [f'{nld_data.shape[1]} columns, expected 2 or 3 (E, NLD[, dNLD])']
+
+    values = nld_data.apply(pd.to_numeric, errors='coerce').to_numpy(dtype=float)
+
+    errors = []
+    for column, name in enumerate(['E', 'NLD', 'dNLD'][:values.shape[1]]):
+        n_bad = np.count_nonzero(~np.isfinite(values[:, column]))
+        if n_bad and name != 'dNLD':
+            errors.append(f'{n_bad} non-numeric values in the {name} column')
+
+    if values.shape[1] == 3 and np.any(values[:, 2] < 0):
+        errors.append('negative uncertainties')
+
+    if len(values) == 0:
+        errors.append('no data points')
+
+    return (None if errors else values), errors
+
+
+def normalize(values):
+    '''Function to bring the arrays of a data file into the form the website uses: sorted by energy, with missing or zero
+    uncertainties replaced by 20% of the level density (see utils/data_store.read_nld_file).
+    Output: (n, 3) float64 array with the columns E, NLD, dNLD.'''
+
+    values = values[np.argsort(values[:, 0], kind='stable')]
+
+    E, nld = values[:, 0], values[:, 1]
+    dnld = values[:, 2] if values.shape[1] > 2 else np.zeros_like(nld)
+    dnld = np.where(np.isnan(dnld) | (dnld == 0), DEFAULT_RELATIVE_ERROR * nld, dnld)
+
+    return np.column_stack([E, nld, dnld])
+
+
+def check_row(row):
+    '''Function to check the log book entries of a data set against the name of its data file.
+    Output: list of errors.'''
+
+    errors = []
+
+    match = DATAFILE_PATTERN.match(os.path.basename(row['Datafile']))
+    if match is None:
+        errors.append(f'data file name {row["Datafile"]} does not look like NLD_<Z>_<A>_<n>.csv')
+    else:
+        Z, A = int(match.group(1)), int(match.group(2))
+        if Z != row['Z'] or A != row['A']:
+            errors.append(f'data file name says Z={Z}, A={A} but the log book says Z={row["Z"]}, A={row["A"]}')
+
+    if row['Datafile'].split('/')[0] not in DATA_DIRS:
+        errors.append(f'data file is not in one of the directories {", ".join(DATA_DIRS)}')
+
+    isotope = re.match(r'^(\d+)', str(row['Isotope']))
+    if isotope and int(isotope.group(1)) != row['A']:
+        errors.append(f'isotope {row["Isotope"]} does not match A={row["A"]}')
+
+    if not row['Emin'] < row['Emax']:
+        errors.append(f'fitting window Emin={row["Emin"]}, Emax={row["Emax"]} is empty')
+
+    return errors
+
+
+def trial_fits(array, row):
+    '''Function to fit the CT and BSFG models over the fitting window of the row, as the website would.
+    Output: dictionary {model: parameters or error}.'''
+
+    x, y, dy = fit_window(array[:, 0], array[:, 1], array[:, 2], row['Emin'], row['Emax'])
+
+    fits = {}
+    for model in TRIAL_FIT_MODELS:
+        try:
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore')
+                popt, pcov = ctm_fit(x, y, dy) if model == 'CTM' else bsfg_fit(x, y, dy, row['A'])
+            if not np.all(np.isfinite(popt)):
+                raise ValueError('non-finite parameters')
+            fits[model] = {'parameters': [float(p) for p in popt], 'errors': [float(e) for e in np.sqrt(np.abs(np.diag(pcov)))]}
+        except Exception as error:
+            fits[model] = {'error': str(error)}
+
+    return fits
+
+
+def validate_dataset(task):
+    '''Function to validate one data set (run in a worker process).
+    Input: tuple (row of the log book as a dictionary, path of the data file, directory for normalized files or None, run trial fits).
+    Output: report entry with the status ("ok", "warning" or "error"), the errors, the warnings and the trial fits.'''
+
+    row, path, normalize_dir, run_fits = task
+
+    start = time.perf_counter()
+    errors = check_row(row)
+    warning_list = []
+    entry = {'Name': row['Name'], 'Datafile': row['Datafile'], 'path': path}
+
+    values, file_errors = parse_nld_file(path)
+    errors += file_errors
+
+    if values is not None:
+        E, nld = values[:, 0], values[:, 1]
+        entry['n_points'] = int(len(values))
+        entry['columns'] = int(values.shape[1])
+
+        steps = np.diff(E)
+        if np.any(steps < 0):
+            warning_list.append('energies are not increasing (sorted when normalized)')
+        if np.any(steps == 0):
+            warning_list.append(f'{np.count_nonzero(steps == 0)} repeated energies')
+        if np.any(nld <= 0):
+            warning_list.append(f'{np.count_nonzero(nld <= 0)} points with NLD <= 0')
+        if values.shape[1] == 2:
+            warning_list.append(f'no uncertainties, {DEFAULT_RELATIVE_ERROR:.0%} is assumed')
+
+        array = normalize(values)
+
+        if run_fits and not errors:
+            entry['fits'] = trial_fits(array, row)
+            for model, fit in entry['fits'].items():
+                if 'error' in fit:
+                    warning_list.append(f'trial {model} fit failed: {fit["error"]}')
+
+        if normalize_dir and not errors:
+            output = os.path.join(normalize_dir, os.path.splitext(row['Datafile'])[0] + '.npy')
+            os.makedirs(os.path.dirname(output), exist_ok=True)
+            np.save(output, array)
+            entry['normalized'] = output
+
+    entry['status'] = 'error' if errors else 'warning' if warning_list else 'ok'
+    entry['errors'] = errors
+    entry['warnings'] = warning_list
+    entry['seconds'] = round(time.perf_counter() - start, 4)
+
+    return entry
+
+
+def unlisted_files(df):
+    '''Function to find the data files in the data directories that have no row in the log book.'''
+
+    listed = set(df['Datafile'])
+
+    return sorted(os.path.join(d, f) for d in DATA_DIRS if os.path.isdir(resolve_path(d))
+                  for f in os.listdir(resolve_path(d)) if f.endswith('.csv') and os.path.join(d, f) not in listed)
+
+
+def ingest(log_book=None, datafiles=None, normalize_dir=None, run_fits=True, jobs=None):
+    '''Function to validate the data sets of the log book in parallel.
+    Inputs: path of the log book (default: the current one), data files to check (default: all rows of the log book),
+    directory for the normalized files (None: do not write them), whether to run the trial fits, number of processes.
+    Output: report dictionary with a summary and one entry per data set.'''
+
+    start = time.perf_counter()
+
+    df = read_catalogue(log_book)
+    if datafiles:
+        datafiles = [os.path.relpath(d) for d in datafiles]
+        df = df[df['Datafile'].isin(datafiles)]
+
+    rows = [{key: (None if pd.isna(value) else value) for key, value in row.items()}
+            for row in df[['Name', 'Datafile', 'Isotope', 'Z', 'A', 'Emin', 'Emax']].to_dict('records')]
+    tasks = [(row, resolve_path(row['Datafile']), normalize_dir, run_fits) for row in rows]
+
+    if jobs == 1:
+        entries = [validate_dataset(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            entries = list(pool.map(validate_dataset, tasks, chunksize=CHUNK_SIZE))
+
+    duplicates = df['Datafile'][df['Datafile'].duplicated()].tolist()
+    for entry in entries:
+        if entry['Datafile'] in duplicates:
+            entry['errors'].append('data file is listed more than once in the log book')
+            entry['status'] = 'error'
+
+    # data files given on the command line without a row in the log book, or (for the whole archive) files nobody lists.
+    missing = sorted(set(datafiles) - set(df['Datafile'])) if datafiles else []
+    unlisted = [] if datafiles else unlisted_files(df)
+
+    counts = {status: sum(entry['status'] == status for entry in entries) for status in ('ok', 'warning', 'error')}
+
+    return {
+        'summary': dict(datasets=len(entries), **counts, missing_from_log_book=missing, unlisted_files=unlisted,
+                        seconds=round(time.perf_counter() - start, 3)),
+        'datasets': entries,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Validate (and normalize) the level density data sets of the log book.')
+    parser.add_argument('datafiles', nargs='*', help='data files to check, e.g. Accepted/NLD_26_57_1.csv (default: all)')
+    parser.add_argument('--log-book', default=None, help=f'log book to check (default: {LOG_BOOK})')
+    parser.add_argument('--report', default=None, help='write the JSON report to this file instead of stdout')
+    parser.add_argument('--normalize', default=None, metavar='DIR', help='write the normalized arrays of the valid files as .npy to DIR')
+    parser.add_argument('--no-fits', action='store_true', help='skip the trial CT/BSFG fits')
+    parser.add_argument('--jobs', type=int, default=None, help='number of processes (default: number of cores)')
+    args = parser.parse_args(argv)
+
+    report = ingest(args.log_book, args.datafiles, args.normalize, not args.no_fits, args.jobs)
+
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump(report, f, indent=1)
+    else:
+        json.dump(report, sys.stdout, indent=1)
+        sys.stdout.write('\n')
+
+    summary = report['summary']
+    print(f'{summary["datasets"]} data sets in {summary["seconds"]} s: {summary["ok"]} ok, {summary["warning"]} with warnings, '
+          f'{summary["error"]} with errors', file=sys.stderr)
+
+    return 1 if summary['error'] or summary['missing_from_log_book'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
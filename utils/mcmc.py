@@ -0,0 +1,158 @@
+'''
+Bayesian (MCMC) fitting of the CT and BSFG models.
+
+The posterior is sampled with an affine-invariant ensemble sampler (Goodman & Weare stretch move).
+The log-likelihood of a whole half-ensemble of walkers is evaluated in one numpy call, so a typical
+data set is sampled in well under a second. The plotting callback that asks for it runs as a background job
+(see pages/search_Z_A.py), and the posterior summaries are cached by (Datafile, model, fitting window).
+'''
+
+import numpy as np
+from utils.cache import cache, CACHE_EXPIRE
+from utils.data_store import load_nld_data, dataset_version, fit_window
+from utils.fitting_functions import ctm_log_density, bsfg_log_density, ctm_fit, bsfg_fit, bsfg_bounds
+
+
+# Sampler settings. 32 walkers x 2000 steps (500 of them burn-in) is plenty for the 2 parameter models.
+N_WALKERS = 32
+N_STEPS = 2000
+N_BURN = 500
+
+# Number of posterior draws used for the uncertainty band of the fitted curve.
+N_BAND_SAMPLES = 200
+
+PARAMETER_NAMES = {'CTM': ('T', 'E0'), 'BSFG': ('a', 'Delta')}
+
+
+def log_density(model, theta, E, A):
+    '''Function to evaluate the log level density for many parameter sets at once.
+    Inputs: model ('CTM' or 'BSFG'), parameters with shape (n_walkers, 2), energies, mass number.
+    Output: log level density with shape (n_walkers, len(E)).'''
+
+    p1, p2 = theta[:, 0:1], theta[:, 1:2]
+
+    if model == 'CTM':
+        return ctm_log_density(E, p1, p2)
+
+    return bsfg_log_density(E, p1, p2, A)
+
+
+def log_posterior(model, theta, x, y, dy, A, bounds):
+    '''Function to evaluate the log posterior of all walkers in a single vectorized call.
+    Gaussian likelihood (the same chi^2 that curve_fit minimizes) with flat priors inside the bounds.
+    Output: log posterior of every walker, -inf outside the prior bounds.'''
+
+    lower, upper = bounds
+    inside = np.all((theta > lower) & (theta < upper), axis=1)
+
+    with np.errstate(over='ignore', invalid='ignore'):
+        rho = np.exp(log_density(model, theta, x, A))
+        chi2 = np.sum(((y - rho) / dy)**2, axis=1)
+
+    return np.where(inside & np.isfinite(chi2), -0.5 * chi2, -np.inf)
+
+
+def ensemble_sampler(log_prob, p0, n_steps, rng, stretch=2.0):
+    '''Affine-invariant ensemble sampler (Goodman & Weare 2010, stretch move).
+    The walkers are split in two halves and each half is moved using the other one, so every call of
+    log_prob evaluates half of the ensemble at once.
+    Inputs: vectorized log probability (array of walkers -> array of values), starting positions (n_walkers, n_dim),
+    number of steps, numpy random generator.
+    Outputs: chain with shape (n_steps, n_walkers, n_dim) and the acceptance fraction.'''
+
+    walkers = np.array(p0, dtype=float)
+    n_walkers, n_dim = walkers.shape
+    half = n_walkers // 2
+    halves = (slice(0, half), slice(half, n_walkers))
+
+    log_p = log_prob(walkers)
+    chain = np.empty((n_steps, n_walkers, n_dim))
+    n_accepted = 0
+
+    for step in range(n_steps):
+        for active, complement in (halves, halves[::-1]):
+            moving, partners = walkers[active], walkers[complement]
+            n_moving = len(moving)
+
+            z = ((stretch - 1) * rng.random(n_moving) + 1)**2 / stretch
+            chosen = partners[rng.integers(len(partners), size=n_moving)]
+            proposal = chosen + z[:, None] * (moving - chosen)
+
+            log_p_new = log_prob(proposal)
+            with np.errstate(invalid='ignore'):
+                log_ratio = (n_dim - 1) * np.log(z) + log_p_new - log_p[active]
+            accept = np.log(rng.random(n_moving)) < log_ratio
+
+            walkers[active] = np.where(accept[:, None], proposal, moving)
+            log_p[active] = np.where(accept, log_p_new, log_p[active])
+            n_accepted += np.count_nonzero(accept)
+
+        chain[step] = walkers
+
+    return chain, n_accepted / (n_steps * n_walkers)
+
+
+def sample_posterior(datafile, model, E_min, E_max, A, seed=0):
+    '''Function to sample the posterior of the CT or BSFG parameters of a data set.
+    The walkers start in a small ball around the least squares (curve_fit) solution.
+    Inputs: data file, model ('CTM' or 'BSFG'), minimum and maximum energy of fitting, mass number.
+    Output: dictionary with the median and 16th/84th percentiles of every parameter, the acceptance fraction
+    and the median curve with its 68% band on a grid between Emin and Emax.'''
+
+    x, y, dy = fit_window(*load_nld_data(datafile), E_min, E_max)
+
+    if model == 'CTM':
+        popt, pcov = ctm_fit(x, y, dy)
+        bounds = (np.array([1e-3, -50.0]), np.array([20.0, 50.0]))
+    else:
+        popt, pcov = bsfg_fit(x, y, dy, A)
+        bounds = tuple(np.array(b) for b in bsfg_bounds(x))
+
+    rng = np.random.default_rng(seed)
+
+    scale = np.sqrt(np.abs(np.diag(pcov)))
+    scale = np.where(np.isfinite(scale) & (scale > 0), scale, 1e-3 * np.maximum(np.abs(popt), 1.0))
+    p0 = popt + 0.1 * scale * rng.standard_normal((N_WALKERS, len(popt)))
+    p0 = np.clip(p0, bounds[0] + 1e-9, bounds[1] - 1e-9)
+
+    chain, acceptance = ensemble_sampler(lambda theta: log_posterior(model, theta, x, y, dy, A, bounds),
+                                         p0, N_STEPS, rng)
+
+    samples = chain[N_BURN:].reshape(-1, len(popt))
+    low, median, high = np.percentile(samples, [16, 50, 84], axis=0)
+
+    # uncertainty band of the fitted curve from a subset of the posterior draws.
+    x_fit = np.linspace(E_min, E_max, 100)
+    draws = samples[rng.integers(len(samples), size=N_BAND_SAMPLES)]
+    y_low, y_median, y_high = np.percentile(np.exp(log_density(model, draws, x_fit, A)), [16, 50, 84], axis=0)
+
+    return {
+        'model': model,
+        'parameters': {name: {'median': float(median[k]), 'minus': float(median[k] - low[k]), 'plus': float(high[k] - median[k])}
+                       for k, name in enumerate(PARAMETER_NAMES[model])},
+        'acceptance': float(acceptance),
+        'n_samples': int(len(samples)),
+        'x_fit': x_fit.tolist(),
+        'y_median': y_median.tolist(),
+        'y_low': y_low.tolist(),
+        'y_high': y_high.tolist(),
+    }
+
+
+# ------------------------------------------ cache ------------------------------------------
+
+def posterior_summary(datafile, model, E_min, E_max, A, compute=True):
+    '''Function to get the posterior summary of a data set, sampling it only the first time it is requested.
+    The result is cached (in the shared cache of utils/cache.py) by (Datafile, model, fitting window, mass number).
+    With compute=False the summary is only taken from the cache (None if it has not been sampled yet).'''
+
+    # A is part of the key: the BSFG posterior depends on it, and it can change in the log book without the data file changing.
+    key = ('posterior', datafile, model, float(E_min), float(E_max), int(A), dataset_version(datafile))
+
+    summary = cache.get(key)
+
+    if summary is None and compute:
+        summary = sample_posterior(datafile, model, float(E_min), float(E_max), int(A))
+        cache.set(key, summary, expire=CACHE_EXPIRE, tag=datafile)
+
+    return summary
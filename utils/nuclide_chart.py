@@ -0,0 +1,155 @@
+'''
+Aggregates of the catalogue per nucleus for the nuclide chart (pages/nuclide_chart.py).
+
+The chart shows one cell per nucleus (Z vs N) with the number of data sets, their methods and status, and the mean
+CT temperature and BSFG level density parameter of their fits. The aggregates are computed once per catalogue version
+into small (n_Z, n_N) grid arrays and kept in the shared cache (utils/cache.py), so loading the chart never groups the
+catalogue or fits anything. The fits come from utils/fits.py, so they are shared with the database page and the API.
+'''
+
+import warnings
+import functools
+import numpy as np
+import plotly.graph_objects as go
+from utils.cache import cache, single_flight, CACHE_EXPIRE
+from utils.catalogue import get_catalogue, catalogue_version
+from utils.fits import cached_fit
+
+
+# Status column values, in the order of the status grid (data sets without a status are counted as "Not reviewed").
+STATUSES = ('Accepted', 'Probationary', 'Rejected', 'Not reviewed')
+
+# Quantities that can be shown in the cells of the chart: (grid, title of the colour bar).
+QUANTITIES = {'count': ('count', 'Data sets'), 'T': ('T', 'CT temperature T (MeV)'), 'a': ('a', 'BSFG a (1/MeV)')}
+
+# Number of different charts (quantity and catalogue version) kept per process.
+FIGURE_CACHE_SIZE = 16
+
+
+def fit_parameter(row, model, name):
+    '''Function to get one parameter of the (cached) fit of a data set, nan if the fit fails.'''
+
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            value = cached_fit(row['Datafile'], model, row['Emin'], row['Emax'], row['A'])['parameters'][name]
+    except Exception:
+        return np.nan
+
+    return value if np.isfinite(value) else np.nan
+
+
+def build_aggregates(df):
+    '''Function to aggregate the catalogue per nucleus.
+    Input: the catalogue.
+    Output: dictionary of numpy arrays -- Z and N (axes of the grid), count, status (one grid per entry of STATUSES),
+    methods (list of the methods of every cell), T and a (mean fit parameters, nan where no fit is available).'''
+
+    Z = df['Z'].to_numpy(dtype=int)
+    N = df['A'].to_numpy(dtype=int) - Z
+
+    Z_axis = np.arange(Z.min(), Z.max() + 1)
+    N_axis = np.arange(N.min(), N.max() + 1)
+    shape = (len(Z_axis), len(N_axis))
+
+    # flat cell number of every data set.
+    cells = np.ravel_multi_index((Z - Z_axis[0], N - N_axis[0]), shape)
+    n_cells = shape[0] * shape[1]
+
+    count = np.bincount(cells, minlength=n_cells)
+
+    status = df['Status'].fillna('Not reviewed').to_numpy(dtype=object)
+    status_count = np.stack([np.bincount(cells[status == s], minlength=n_cells) for s in STATUSES])
+
+    # one list of methods per occupied cell (most cells are empty, so no grid of strings is stored).
+    methods = {}
+    for cell, method in zip(cells, df['Method']):
+        methods.setdefault(int(cell), set()).add(str(method))
+
+    aggregates = {'Z': Z_axis, 'N': N_axis, 'count': count.reshape(shape), 'status': status_count.reshape((len(STATUSES),) + shape),
+                  'methods': {cell: sorted(m) for cell, m in methods.items()}}
+
+    for name, model in (('T', 'CTM'), ('a', 'BSFG')):
+        values = np.array([fit_parameter(row, model, name) for _, row in df.iterrows()])
+        ok = np.isfinite(values)
+        n_fits = np.bincount(cells[ok], minlength=n_cells)
+        total = np.bincount(cells[ok], weights=values[ok], minlength=n_cells)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            aggregates[name] = np.where(n_fits > 0, total / n_fits, np.nan).reshape(shape)
+
+    return aggregates
+
+
+def chart_aggregates():
+    '''Function to get the aggregates of the current catalogue (see build_aggregates).
+    They are computed once per catalogue version and shared by all processes through the cache.'''
+
+    version = catalogue_version()
+
+    return _aggregates(version)
+
+
+@functools.lru_cache(maxsize=2)
+def _aggregates(version):
+    key = ('nuclide-chart', version)
+
+    aggregates = cache.get(key)
+    if aggregates is None:
+        aggregates = single_flight.do(key, _compute_aggregates, key)
+
+    return aggregates
+
+
+def _compute_aggregates(key):
+    aggregates = cache.get(key)
+
+    if aggregates is None:
+        aggregates = build_aggregates(get_catalogue())
+        cache.set(key, aggregates, expire=CACHE_EXPIRE)
+
+    return aggregates
+
+
+def hover_text(aggregates):
+    '''Function to write the hover text of every cell of the chart.
+    Output: (n_Z, n_N) array of strings (empty for cells without data).'''
+
+    Z, N = aggregates['Z'], aggregates['N']
+    text = np.full(aggregates['count'].shape, '', dtype=object)
+
+    for i, j in zip(*np.nonzero(aggregates['count'])):
+        cell = i * len(N) + j
+        statuses = ', '.join(f'{s}: {aggregates["status"][k, i, j]}' for k, s in enumerate(STATUSES) if aggregates['status'][k, i, j])
+        fits = ', '.join(f'{name} = {aggregates[name][i, j]:.2f}' for name in ('T', 'a') if np.isfinite(aggregates[name][i, j]))
+        text[i, j] = (f'Z = {Z[i]}, N = {N[j]}, A = {Z[i] + N[j]}<br>Data sets: {aggregates["count"][i, j]}'
+                      f'<br>Methods: {", ".join(aggregates["methods"][cell])}<br>{statuses}' + (f'<br>Mean fit: {fits}' if fits else ''))
+
+    return text
+
+
+def chart_figure(quantity='count'):
+    '''Function to get the nuclide chart of the current catalogue, colored by the number of data sets or a mean fit parameter.
+    The figure is made once per quantity and catalogue version.
+    Output: the figure as a dictionary (ready to be sent to dcc.Graph).'''
+
+    return _chart_figure(catalogue_version(), quantity if quantity in QUANTITIES else 'count')
+
+
+@functools.lru_cache(maxsize=FIGURE_CACHE_SIZE)
+def _chart_figure(version, quantity):
+    aggregates = _aggregates(version)
+
+    grid, title = QUANTITIES[quantity]
+    z = np.where(aggregates['count'] > 0, aggregates[grid], np.nan).astype(float)
+
+    fig = go.Figure(go.Heatmap(x=aggregates['N'], y=aggregates['Z'], z=z, text=hover_text(aggregates), hoverinfo='text',
+                               colorscale='Plasma', colorbar=dict(title=dict(text=title, font=dict(color='orange')), tickfont=dict(color='orange')),
+                               xgap=1, ygap=1, hoverongaps=False))
+
+    fig.update_layout(template=None, paper_bgcolor='rgb(30,30,30)', plot_bgcolor='rgb(30,30,30)', height=700,
+                      margin=dict(l=60, r=20, t=20, b=60))
+    fig.update_xaxes(title_text='Neutron number N', color='orange', showgrid=False, zeroline=False, linecolor='orange', mirror=True)
+    fig.update_yaxes(title_text='Proton number Z', color='orange', showgrid=False, zeroline=False, linecolor='orange', mirror=True,
+                     scaleanchor='x')
+
+    return fig.to_plotly_json()
@@ -0,0 +1,121 @@
+'''
+Search index of the reactions in the catalogue (the Reaction column of the log book, e.g. "p,t; d,d").
+
+The reaction dropdown of the database page suggests reactions while the user types, and the reaction filter
+selects the data sets whose reactions contain the query. Both are substring searches over normalized reaction
+strings (see normalize_reaction). Instead of scanning every string per query, the strings are put in an n-gram index:
+every substring of up to N_GRAM characters points to the strings that contain it. A short query is a single lookup,
+a longer one intersects the lists of its n-grams and only checks the few strings that are left.
+'''
+
+import re
+import numpy as np
+
+
+N_GRAM = 3
+
+
+def normalize_reaction(reaction):
+    '''Function to normalize a reaction string for searching: no spaces or brackets, lower case (e.g. "(7Li, p)" -> "7li,p").'''
+
+    return re.sub(r'\s+|\(|\)', '', reaction).lower()
+
+
+class NgramIndex:
+    '''Substring index of a list of strings.
+    Input: the strings (already normalized).'''
+
+    def __init__(self, strings):
+        self.strings = list(strings)
+        self._postings = {}
+
+        for k, string in enumerate(self.strings):
+            for n in range(1, N_GRAM + 1):
+                for start in range(len(string) - n + 1):
+                    self._postings.setdefault(string[start:start + n], set()).add(k)
+
+        self._all = set(range(len(self.strings)))
+
+    def search(self, query):
+        '''Function to find the strings that contain the query.
+        Output: set of positions in the list of strings.'''
+
+        if not query:
+            return set(self._all)
+
+        if len(query) <= N_GRAM:
+            return set(self._postings.get(query, ()))
+
+        # candidates contain every n-gram of the query (rarest first, so the intersection shrinks fast).
+        grams = sorted({query[start:start + N_GRAM] for start in range(len(query) - N_GRAM + 1)},
+                       key=lambda gram: len(self._postings.get(gram, ())))
+        candidates = set(self._postings.get(grams[0], ()))
+        for gram in grams[1:]:
+            if not candidates:
+                break
+            candidates &= self._postings.get(gram, set())
+
+        return {k for k in candidates if query in self.strings[k]}
+
+
+class ReactionIndex:
+    '''Reaction search index of a catalogue.
+    Two indexes are kept: one over the Reaction column of every data set (the filter matches the query against the whole
+    column, as the website always did) and one over the individual reactions (for the suggestions of the dropdown).
+    Input: the catalogue (pandas DataFrame with the Reaction and Name columns).'''
+
+    def __init__(self, df):
+        normalized = [normalize_reaction(r) if isinstance(r, str) else None for r in df['Reaction']]
+
+        # data sets with the same Reaction column share one entry of the index.
+        entries = {}
+        for position, entry in enumerate(normalized):
+            if entry is not None:
+                entries.setdefault(entry, []).append(position)
+
+        self._columns = NgramIndex(entries)
+        self._positions = [np.array(positions) for positions in entries.values()]
+        self._labels = df.index.to_numpy()
+        self._names = df['Name'].to_numpy()
+
+        # individual reactions (e.g. "p,t" and "d,d" from "p,t; d,d"), most common first.
+        counts = {}
+        for reactions in df['Reaction']:
+            if isinstance(reactions, str):
+                for reaction in reactions.split(';'):
+                    reaction = reaction.strip()
+                    if reaction:
+                        counts[reaction] = counts.get(reaction, 0) + 1
+
+        self.reactions = sorted(counts, key=lambda reaction: (-counts[reaction], reaction))
+        self._reactions = NgramIndex(normalize_reaction(reaction) for reaction in self.reactions)
+
+    def positions(self, query):
+        '''Function to find the data sets whose reactions contain the query.
+        Output: sorted array of row positions in the catalogue.'''
+
+        matches = self._columns.search(normalize_reaction(query))
+        if not matches:
+            return np.array([], dtype=int)
+
+        return np.sort(np.concatenate([self._positions[k] for k in matches]))
+
+    def labels(self, query):
+        '''Function to find the data sets whose reactions contain the query.
+        Output: array of index labels of the catalogue.'''
+
+        return self._labels[self.positions(query)]
+
+    def names(self, query):
+        '''Function to find the data sets whose reactions contain the query.
+        Output: array of dataset IDs (the Name column).'''
+
+        return self._names[self.positions(query)]
+
+    def suggest(self, search_value, limit=None):
+        '''Function to suggest reactions for what the user typed (all reactions if nothing is typed), most common first.
+        Output: list of reactions.'''
+
+        matches = sorted(self._reactions.search(normalize_reaction(search_value or '')))
+
+        return [self.reactions[k] for k in matches[:limit]]
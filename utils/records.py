@@ -0,0 +1,77 @@
+'''
+Compact form of the catalogue for the callbacks: one numpy array per column (struct of arrays).
+
+The callbacks of the database page only need a few columns of the few selected data sets. Building DataFrames and
+lists of dictionaries (to_dict('records')) for them costs more than the lookups themselves, so every catalogue is
+turned once into CatalogueArrays: the column arrays, and a dictionary from the dataset IDs of the table (the Name column)
+to the integer row positions. A selection is resolved with one dictionary lookup per data set, and every selected
+data set is a Record -- a (column arrays, position) pair that reads the values directly from the arrays.
+'''
+
+import numpy as np
+
+
+class Record:
+    '''One data set of a catalogue, read from the column arrays of CatalogueArrays (nothing is copied).
+    Values are read like the dictionaries of to_dict('records'), e.g. record['Datafile'], and are plain python values.'''
+
+    __slots__ = ('_columns', 'position')
+
+    def __init__(self, columns, position):
+        self._columns = columns
+        self.position = position
+
+    def __getitem__(self, column):
+        value = self._columns[column][self.position]
+
+        return value.item() if isinstance(value, np.generic) else value
+
+    def get(self, column, default=None):
+        return self[column] if column in self._columns else default
+
+    def keys(self):
+        return self._columns.keys()
+
+    def to_dict(self):
+        '''Function to copy the record into a dictionary (e.g. to send it as JSON).'''
+
+        return {column: self[column] for column in self._columns}
+
+    def __repr__(self):
+        return f'Record({self["Name"]!r})'
+
+
+class CatalogueArrays:
+    '''Struct-of-arrays form of a catalogue, rows addressed by their integer position.
+    Input: the catalogue (pandas DataFrame with the Name column).'''
+
+    def __init__(self, df):
+        self.columns = {column: df[column].to_numpy() for column in df.columns}
+        self.positions = {name: k for k, name in enumerate(self.columns['Name'])}
+
+    def __len__(self):
+        return len(self.positions)
+
+    def ids(self, names):
+        '''Function to get the row positions of data sets from their IDs (the Name column), in the given order.
+        IDs that are not in the catalogue are skipped.
+        Output: integer array.'''
+
+        positions = self.positions
+
+        return np.array([positions[name] for name in names or [] if name in positions], dtype=int)
+
+    def records(self, names):
+        '''Function to get the records of data sets from their IDs (the Name column), in the given order.
+        IDs that are not in the catalogue are skipped.
+        Output: list of Record.'''
+
+        columns, positions = self.columns, self.positions
+
+        return [Record(columns, positions[name]) for name in names or [] if name in positions]
+
+    def column(self, column, names):
+        '''Function to get one column of the given data sets (e.g. their data files) with a single fancy indexing.
+        Output: numpy array.'''
+
+        return self.columns[column][self.ids(names)]
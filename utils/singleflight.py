@@ -0,0 +1,126 @@
+'''
+Coalescing of identical concurrent computations ("single flight").
+
+When many users select the same data sets at the same time (e.g. a class opening the website together),
+the same figures and zip files would be computed once per request. SingleFlight.do runs the computation
+once per key: threads of the same process that ask for a key that is already being computed wait for that
+result instead of starting their own computation.
+
+Optionally the coalescing also works across processes (gunicorn workers and background jobs). A file lock
+makes the other processes wait, and the result is handed over through the shared cache. The keys are hashed onto a
+fixed number of lock files (LOCK_STRIPES), so the lock directory does not grow with every new selection; two keys that
+share a lock file are just computed one after the other.
+File locks need fcntl, so on systems without it only the in-process coalescing is done.
+'''
+
+import os
+import hashlib
+import threading
+
+try:
+    import fcntl
+except ImportError:  # e.g. Windows
+    fcntl = None
+
+
+_MISSING = object()
+
+# Number of lock files in the lock directory.
+LOCK_STRIPES = 256
+
+
+class _Call:
+    '''A computation in flight: the threads waiting for it block on event.'''
+
+    __slots__ = ('event', 'result', 'error')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    '''Runs a computation at most once at a time per key and shares the result with everybody who asked for it.
+    Inputs: lock_dir -- directory for the lock files (None: coalesce within this process only),
+    result_cache -- a diskcache.Cache used to hand the result to the other processes,
+    expire -- seconds a shared result stays available for requests that arrive just after the computation finished.'''
+
+    def __init__(self, lock_dir=None, result_cache=None, expire=60):
+        self.lock_dir = lock_dir if fcntl is not None and result_cache is not None else None
+        self.result_cache = result_cache
+        self.expire = expire
+
+        self._calls = {}
+        self._lock = threading.Lock()
+        # lock files held by the current thread (a computation that runs another one on the same lock file must not wait for itself).
+        self._held = threading.local()
+
+        if self.lock_dir:
+            os.makedirs(self.lock_dir, exist_ok=True)
+
+    def do(self, key, fn, *args, **kwargs):
+        '''Function to compute fn(*args, **kwargs), or to wait for the result if the same key is already being computed.
+        The key must be a normalized description of the request (only hashable, plain values).
+        Output: the result of fn (exceptions of fn are raised in every waiting thread).'''
+
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = self._do_shared(key, fn, args, kwargs)
+        except BaseException as error:
+            call.error = error
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+
+        return call.result
+
+    def _do_shared(self, key, fn, args, kwargs):
+        '''Function to run the computation while holding the lock file of the key, so that other processes
+        asking for the same key wait and then pick up the result from the shared cache.'''
+
+        if not self.lock_dir:
+            return fn(*args, **kwargs)
+
+        digest = hashlib.sha256(repr(key).encode('utf-8')).hexdigest()
+        cache_key = ('singleflight', digest)
+        stripe = int(digest, 16) % LOCK_STRIPES
+
+        held = self._held.__dict__.setdefault('stripes', set())
+        if stripe in held:
+            return self._compute_shared(cache_key, fn, args, kwargs)
+
+        # The lock is released by the operating system if the process dies (e.g. a cancelled background job).
+        with open(os.path.join(self.lock_dir, f'{stripe:03d}.lock'), 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            held.add(stripe)
+            try:
+                result = self._compute_shared(cache_key, fn, args, kwargs)
+            finally:
+                held.discard(stripe)
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+        return result
+
+    def _compute_shared(self, cache_key, fn, args, kwargs):
+        '''Function to take the result from the shared cache, or to compute it and put it there.'''
+
+        result = self.result_cache.get(cache_key, default=_MISSING)
+        if result is _MISSING:
+            result = fn(*args, **kwargs)
+            self.result_cache.set(cache_key, result, expire=self.expire)
+
+        return result
@@ -0,0 +1,129 @@
+'''
+Hot reload of the catalogue and the data files.
+
+New data sets are added by editing the log book and copying csv files into the data directory (NLD_DATA_DIR,
+the /srv/nld-db volume of docker-compose.yml). Every web server process runs a CatalogueWatcher thread that
+checks the files every few seconds. When something changed it reloads only what is affected:
+
+- changed data files are read again (their cached arrays are replaced) and their cached fits are evicted,
+- if the log book changed, the new catalogue is read, and the fits of data sets whose row changed (e.g. a new fitting window) are evicted,
+- finally the new catalogue is swapped in at once (utils/catalogue.swap_catalogue), and the aggregates of the nuclide chart and
+  the whole-archive download (utils/export.py) are prepared.
+
+Requests keep being served from the old catalogue and the warm caches while the new one is prepared, so adding
+data needs no restart and causes no cold-cache latency spike.
+'''
+
+import os
+import threading
+import traceback
+import pandas as pd
+from utils import data_store
+from utils.cache import cache
+from utils.catalogue import LOG_BOOK, scan_files, files_version, read_catalogue, get_catalogue, swap_catalogue
+from utils.nuclide_chart import chart_aggregates
+from utils.export import build_archive
+
+
+# Seconds between two checks of the data directory.
+WATCH_INTERVAL = float(os.environ.get('NLD_WATCH_INTERVAL', 10))
+
+# Columns of the log book that change the fits of a data set.
+FIT_COLUMNS = ['A', 'Emin', 'Emax']
+
+
+class CatalogueWatcher(threading.Thread):
+    '''Background thread that reloads the catalogue and the data files when they change on disk.'''
+
+    def __init__(self, interval=WATCH_INTERVAL):
+        super().__init__(name='catalogue-watcher', daemon=True)
+        self.interval = interval
+        self.files = scan_files()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        try:
+            build_archive()
+        except Exception:
+            traceback.print_exc()
+
+        while not self._stop_event.wait(self.interval):
+            try:
+                self.check()
+            except Exception:
+                # e.g. a log book that is only half written: try again at the next check.
+                traceback.print_exc()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def check(self):
+        '''Function to compare the files with the last check and reload what changed.
+        Output: the set of files that changed.'''
+
+        files = scan_files()
+        changed = {path for path in set(files) | set(self.files) if files.get(path) != self.files.get(path)}
+
+        if changed:
+            self.reload(changed, files)
+
+        # only remember the new state once the reload worked, otherwise it is retried at the next check.
+        self.files = files
+
+        return changed
+
+    def reload(self, changed, files):
+        '''Function to reload the changed files and swap in the new catalogue.'''
+
+        old_catalogue = get_catalogue()
+
+        for datafile in sorted(changed - {LOG_BOOK}):
+            if datafile in files:
+                data_store.reload(datafile)
+            else:
+                data_store.invalidate(datafile)
+            cache.evict(datafile)
+
+        if LOG_BOOK in changed:
+            new_catalogue = read_catalogue()
+
+            for datafile in changed_rows(old_catalogue, new_catalogue):
+                cache.evict(datafile)
+        else:
+            new_catalogue = old_catalogue
+
+        swap_catalogue(new_catalogue, files_version(files))
+
+        # prepare the nuclide chart and the archive file of the new catalogue now, so the first visitor does not wait for them.
+        chart_aggregates()
+        build_archive()
+
+
+def changed_rows(old, new):
+    '''Function to find the data sets whose fitting inputs (mass number, fitting window) changed, or that were removed.
+    Output: list of data files.'''
+
+    merged = pd.merge(old[['Datafile'] + FIT_COLUMNS], new[['Datafile'] + FIT_COLUMNS], on='Datafile', how='left',
+                      suffixes=('_old', '_new'))
+
+    changed = pd.Series(False, index=merged.index)
+    for column in FIT_COLUMNS:
+        changed |= ~((merged[column + '_old'] == merged[column + '_new']) |
+                     (merged[column + '_old'].isna() & merged[column + '_new'].isna()))
+
+    return merged['Datafile'][changed].tolist()
+
+
+_watcher = None
+
+
+def start_watcher():
+    '''Function to start the watcher thread of this process (only once).'''
+
+    global _watcher
+
+    if _watcher is None or not _watcher.is_alive():
+        _watcher = CatalogueWatcher()
+        _watcher.start()
+
+    return _watcher
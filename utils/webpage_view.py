@@ -4,15 +4,25 @@ import pandas as pd
 import dash_bootstrap_components as dbc
 
 
-df_NLD = pd.read_excel('log_book_new.xlsx')
+from utils.catalogue import get_catalogue
+
+
+# Columns of the log book shown in the data table (the other ones are only used by the callbacks).
+TABLE_COLUMNS = ['Isotope','Z','A','Emin','Emax','Method','Reaction','Reference']
+
+TABLE_PAGE_SIZE = 10
+
+def view(Z=None, A=None, table=None):
+    '''Function to make the layout of the database page.
+    Inputs: proton and mass number to search for, and the first page of the table for them
+    (rows, number of pages, page number, selected rows -- see table_page in pages/search_Z_A.py), all optional.'''
+
+    # the current catalogue (it is reloaded when data sets are added, see utils/watcher.py).
+    df_NLD = get_catalogue()
+
+    table_data, page_count = (table[0], table[1]) if table else ([], 1)
 
-unique_reactions = set()
-for reactions in df_NLD['Reaction']:
-   if isinstance(reactions,str):
-       for reaction in reactions.split(';'):
-           unique_reactions.add(reaction.strip())
 
-def view():
     return \
     html.Div(id="body", className="container scalable", children=[
         html.A(html.H1('Current Archive of Nuclear Density of Levels',className='website_header_database'),href='/',className='header_banner_link_database'),
@@ -20,8 +30,9 @@ def view():
         html.Div(id="app-container", children=[
             html.Div(id="left-column", children=[
                 html.P('Search Criteria:',id='search_criteria_header'),
-                dcc.Dropdown(df_NLD['Z'].sort_values().unique(), id='proton-number', value=None, className="input1", placeholder='Enter Proton Number'),
-                dcc.Dropdown(id='mass-number', value=None, className="input2", placeholder='Enter Mass Number'),
+                dcc.Dropdown(df_NLD['Z'].sort_values().unique(), id='proton-number', value=Z, className="input1", placeholder='Enter Proton Number'),
+                dcc.Dropdown(df_NLD['A'][df_NLD['Z'] == Z].sort_values().unique() if Z is not None else [], id='mass-number', value=A,
+                    className="input2", placeholder='Enter Mass Number'),
 
                 html.Hr(id='criteria_hr'),
 
@@ -32,7 +43,8 @@ def view():
                     ],
                     id="method_btn",inline=True,switch=True),className='method-btn'),
 
-               dcc.Dropdown(id='search_by_reaction',options=[{'label': reaction, 'value': reaction} for reaction in unique_reactions],
+               # the options are suggested by the server while the user types (see update_reaction_options in pages/search_Z_A.py).
+               dcc.Dropdown(id='search_by_reaction',options=[],
                    placeholder="Select or type a reaction",searchable=True,clearable=True,),
 
                html.Div(html.A(html.Button('Clear All Filters', id='clear_filter_btn',className='clear-btn'),href='/search-z-a'),className='clear-btn-container'),
@@ -45,6 +57,11 @@ def view():
                 html.Div([html.Button('Download CSV', id='download_btn', className="button1"),
                     dcc.Download(id="download-data")],className='download-btn-class'),
 
+                # progress of the zip download (it runs as a background job, see create_zip in pages/search_Z_A.py).
+                html.Div([html.Progress(id='download_progress', value='0', max='1'),
+                    html.Button('Cancel', id='cancel_download_btn', className='cancel-btn')],
+                    id='download_progress_container',className='progress-container',style={'display':'none'}),
+
                 
                 html.Div(html.Button('Split/Unsplit plots', id='split_unsplit_btn', className="button2",n_clicks=0)),
 
@@ -55,8 +72,9 @@ def view():
             html.Div(id='center-column', children=[html.Div(dbc.Checklist(options=[{"label": "Select all", "value": 'select all'}],
             id="select_btn",inline=True),className='select-btn'),
 
-            html.Div([dash_table.DataTable(data=[],id='data_log_table', 
+            html.Div([dash_table.DataTable(data=table_data,id='data_log_table', 
                 #columns=[{'id': c, 'name': c,'presentation':'markdown'} for c in df_NLD.columns],
+                columns=[{'id': c, 'name': c} for c in TABLE_COLUMNS],
                 tooltip_header={
                 'Emin': 'Minimum energy value used for the fitting',
                 'Emax': 'Maximum energy value used for the fitting',
@@ -70,7 +88,11 @@ def view():
 
                 style_header={'backgroundColor': 'rgb(30,30,30)','color': 'orange','border':'2px solid white'},
                     style_data={'backgroundColor': 'rgb(50,50,50)','color': 'orange','border':'2px solid white'},
-                    page_size=10,
+                    # paging, sorting and filtering are done on the server (see update_table in pages/search_Z_A.py).
+                    page_size=TABLE_PAGE_SIZE,page_current=0,page_count=page_count,page_action='custom',
+                    sort_action='custom',sort_mode='multi',sort_by=[],
+                    filter_action='custom',filter_query='',
+                    style_filter={'backgroundColor': 'rgb(50,50,50)','color': 'orange','border':'2px solid white'},
                     )]),
 
                 html.Div(dbc.Checklist(options=[{"label": "Reset all", "value": 'deselect all'}],
@@ -87,13 +109,24 @@ def view():
                 html.Div(dbc.RadioItems(options=[{"label": "Log", "value": 'log'},{"label": "Linear", "value":'linear'},],
             value='linear',id="radio_btn",inline=True,switch=True),className='scaling-btn'),
 
+                # comparison of the selected data sets of the same nucleus on a common energy grid (see utils/comparison.py).
+                html.Div(dbc.Checklist(options=[{"label": "Compare data sets of the same nucleus", "value": 'compare'}],
+            value=[],id="compare_btn",inline=True,switch=True,style={'display':'none'}),className='scaling-btn'),
+
                 html.Div(dbc.RadioItems(options=[{'label':'CT Model','value':'CTM'},{'label':'BSFG Model','value':'BSFG'},
-                    {'label':'All Models','value':'All'},{'label':'Reset','value':'Reset'}],
+                    {'label':'GC Model','value':'GC'},{'label':'All Models','value':'All'},
+                    {'label':'CT Model (MCMC)','value':'CTM_MCMC'},{'label':'BSFG Model (MCMC)','value':'BSFG_MCMC'},{'label':'Reset','value':'Reset'}],
         id='radio_btn_fitting',inline=True),className='radio-btn-fitting-container'),
 
+                # progress of plotting/fitting (it runs as a background job, see plot_selected_data in pages/search_Z_A.py).
+                html.Div([html.Progress(id='plot_progress', value='0', max='1'),
+                    html.Button('Cancel', id='cancel_plot_btn', className='cancel-btn')],
+                    id='plot_progress_container',className='progress-container',style={'display':'none'}),
+
+                # only the plotting callback shows the spinner, the graphs of the split grid have their own (see pages/search_Z_A.py).
                 dcc.Loading(children=[
                     html.Div(id="div-graphs")
-                ])
+                ],target_components={'div-graphs':'children'})
             ]),                   
         ]),
     ]),